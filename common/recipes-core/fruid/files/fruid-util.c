@@ -29,6 +29,8 @@
 #define EEPROM_READ     0x1
 #define EEPROM_WRITE    0x2
 #define FRUID_SIZE      256
+/* Tells the REST API's FRUID cache to look at the EEPROMs again */
+#define FRUID_CACHE     "/usr/local/bin/fruid_cache.py"
 
 /* To copy the bin files */
 static int
@@ -272,6 +274,10 @@ int main(int argc, char * argv[]) {
       close(fd_newbin);
       close(fd_tmpbin);
 
+      if (access(FRUID_CACHE, X_OK) == 0) {
+        system(FRUID_CACHE " --invalidate");
+      }
+
     } else {
       /* FRUID PRINT ONE FRU */
 
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Measures how the cost of an fscd tick scales with the number of zones (N),
+# sensors per zone (M) and bindings per zone expression (K). Configs and
+# zone files are generated, sensor readings are a seeded random walk, so
+# the same arguments give the same workload on every commit. For each
+# case it runs Zone.run() alone and the whole control loop (through
+# fsc_replay), each in a child process so peak RSS is per case, e.g.:
+#
+#   fsc_bench.py -n 1,4,16 -m 8,32 -k 1,4 -o before.json
+#   fsc_bench.py -n 1,4,16 -m 8,32 -k 1,4 -b before.json
+#
+# Python 2 has no allocation tracer; 'gc_objects_per_tick' is the net
+# number of gc tracked objects created per tick, which catches leaks and
+# growing per-tick garbage.
+
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import fscd
+from fsc_replay import replay
+from fsc_sensor import SensorValue
+
+FRUS = 4
+PROFILES = ['linear_t', 'interp_t', 'pid_t']
+
+
+def make_config(zones, sensors, bindings, interval_ms=3000):
+    '''
+    Returns (config, {expr file name: source}, {fru: [sensor names]}) for
+    'zones' zones reading 'sensors' sensors each through 'bindings' nested
+    bindings
+    '''
+    table = [[20 + 2 * i, 10 + 2 * i] for i in range(40)]
+    config = {
+        'pwm_transition_value': 70,
+        'pwm_boost_value': 100,
+        'sample_interval_ms': interval_ms,
+        'watchdog': False,
+        'min_rpm': 800,
+        'profiles': {
+            'linear_t': {'type': 'linear', 'data': table[::2],
+                         'positive_hysteresis': 0,
+                         'negative_hysteresis': 1},
+            'interp_t': {'type': 'interpolated', 'data': table,
+                         'positive_hysteresis': 0,
+                         'negative_hysteresis': 1},
+            'pid_t': {'type': 'pid', 'setpoint': 60, 'kp': 1.5, 'ki': 0.02,
+                      'kd': 0.5, 'positive_hysteresis': 2,
+                      'negative_hysteresis': 2},
+        },
+        'zones': {},
+    }
+    sources = {}
+    fru_sensors = {}
+    bindings = max(1, min(bindings, sensors))
+    for z in range(zones):
+        names = []
+        for s in range(sensors):
+            fru = 'fru%d' % (s % FRUS,)
+            sname = 'z%d_s%d' % (z, s)
+            fru_sensors.setdefault(fru, []).append(sname)
+            names.append(fru + ':' + sname)
+        lines = []
+        outputs = []
+        for b in range(bindings):
+            group = names[b::bindings]
+            lines.append('b%d = max([%s]);' % (b, ', '.join(group)))
+            profile = PROFILES[b % len(PROFILES)]
+            if profile == 'pid_t':
+                outputs.append('linear_t(b%d) + pid_t(b%d)' % (b, b))
+            else:
+                outputs.append('%s(hold(b%d))' % (profile, b))
+        lines.append('max([%s])' % (', '.join(outputs),))
+        filename = 'zone%d.fsc' % (z,)
+        sources[filename] = '\n'.join(lines) + '\n'
+        config['zones']['zone%d' % (z,)] = {
+            'pwm_output': [z % 4],
+            'expr_file': filename,
+        }
+    return (config, sources, fru_sensors)
+
+
+def make_records(fru_sensors, ticks, interval, seed=1):
+    '''Readings for every sensor: a random walk, with some reads missing'''
+    rnd = random.Random(seed)
+    values = {}
+    for fru, names in fru_sensors.items():
+        for sname in names:
+            values[(fru, sname)] = rnd.uniform(30, 70)
+    records = []
+    for i in range(ticks):
+        sensors = {}
+        for fru, names in fru_sensors.items():
+            sensors[fru] = {}
+            for sname in names:
+                v = values[(fru, sname)] + rnd.uniform(-2, 2)
+                values[(fru, sname)] = min(max(v, 20), 100)
+                if rnd.random() < 0.01:
+                    continue
+                sensors[fru][sname] = SensorValue(None, sname, v, 'C', 'ok')
+        records.append((i * interval, sensors, {1: 5000, 2: 5000}))
+    return records
+
+
+def measure(run, ticks):
+    '''Runs run() once and returns its per tick cost'''
+    gc.collect()
+    objects = len(gc.get_objects())
+    gc.disable()
+    try:
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+    finally:
+        gc.enable()
+    return {
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticks_per_s': ticks / max(elapsed, 1e-9),
+        'us_per_tick': elapsed * 1e6 / ticks,
+        'gc_objects_per_tick':
+            float(len(gc.get_objects()) - objects) / ticks,
+    }
+
+
+def bench_case(zones, sensors, bindings, ticks):
+    (config, sources, fru_sensors) = make_config(zones, sensors, bindings)
+    interval = config['sample_interval_ms'] / 1000.0
+    records = make_records(fru_sensors, ticks, interval)
+    zone_dir = tempfile.mkdtemp(prefix='fsc_bench')
+    try:
+        for filename, source in sources.items():
+            with open(os.path.join(zone_dir, filename), 'w') as f:
+                f.write(source)
+        fscd.apply_config(config)
+        bench_zones = fscd.load_zones(dict(config, expr_cache_dir=None),
+                                      zone_dir, sorted(fru_sensors.keys()))
+        def run_zones():
+            for (t, sensors, speeds) in records:
+                for zone in bench_zones:
+                    zone.run(sensors, interval)
+        result = {
+            'zone_run': measure(run_zones, ticks),
+            'loop': measure(lambda: replay(config, zone_dir, records),
+                            ticks),
+        }
+    finally:
+        shutil.rmtree(zone_dir)
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_forked(fn, *args):
+    '''Runs fn(*args) in a child process and returns its (JSON) result'''
+    (r, w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        status = 0
+        try:
+            os.write(w, json.dumps(fn(*args)))
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        os._exit(status)
+    os.close(w)
+    data = ''
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        data += chunk
+    os.close(r)
+    (pid, status) = os.waitpid(pid, 0)
+    if status != 0:
+        raise Exception('benchmark case failed')
+    return json.loads(data)
+
+
+def case_name(zones, sensors, bindings):
+    return 'n%d_m%d_k%d' % (zones, sensors, bindings)
+
+
+def compare(results, baseline, tolerance):
+    '''Prints the ticks/s change against a baseline, returns the regressions'''
+    regressions = []
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            continue
+        for kind in ['zone_run', 'loop']:
+            old = baseline[name][kind]['ticks_per_s']
+            new = results[name][kind]['ticks_per_s']
+            change = (new - old) * 100.0 / old
+            mark = ''
+            if change < -tolerance:
+                mark = '  REGRESSION'
+                regressions.append((name, kind))
+            print('%-16s %-8s %10.0f -> %10.0f ticks/s %+6.1f%%%s' %
+                  (name, kind, old, new, change, mark))
+    return regressions
+
+
+def int_list(s):
+    return [int(i) for i in s.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmark the fscd control loop on synthetic zones')
+    parser.add_argument('-n', '--zones', type=int_list, default=[1, 4, 16],
+                        help='comma separated numbers of zones')
+    parser.add_argument('-m', '--sensors', type=int_list, default=[8, 32],
+                        help='comma separated numbers of sensors per zone')
+    parser.add_argument('-k', '--bindings', type=int_list, default=[1, 4],
+                        help='comma separated numbers of bindings per zone')
+    parser.add_argument('-t', '--ticks', type=int, default=500,
+                        help='ticks per case')
+    parser.add_argument('-o', '--output', help='write the results as JSON')
+    parser.add_argument('-b', '--baseline',
+                        help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='slowdown in %% reported as a regression')
+    args = parser.parse_args()
+
+    fscd.log_to_syslog = False
+    fscd.quiet = True
+    results = {}
+    print('%-16s %14s %12s %14s %12s %10s' %
+          ('case', 'zone_run/s', 'us/tick', 'loop ticks/s', 'gc obj/tick',
+           'peak KB'))
+    for zones in args.zones:
+        for sensors in args.sensors:
+            for bindings in args.bindings:
+                name = case_name(zones, sensors, bindings)
+                r = run_forked(bench_case, zones, sensors, bindings,
+                               args.ticks)
+                results[name] = r
+                print('%-16s %14.0f %12.1f %14.0f %12.2f %10d' %
+                      (name, r['zone_run']['ticks_per_s'],
+                       r['loop']['us_per_tick'], r['loop']['ticks_per_s'],
+                       r['loop']['gc_objects_per_tick'], r['peak_rss_kb']))
+                sys.stdout.flush()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+
+import hashlib
+import json
+import os
+from fsc_sched import monotonic
+
+CHECKPOINT_FILE = '/tmp/fscd_state.json'
+
+
+def config_hash(config, exprs):
+    '''Hash of a config and the (string form of the) zone expressions'''
+    h = hashlib.sha1(json.dumps(config, sort_keys=True))
+    for expr in exprs:
+        h.update('\0' + expr)
+    return h.hexdigest()
+
+
+class Checkpoint:
+    '''
+    Controller state of every zone saved to tmpfs, so that a restarted fscd
+    carries on from where the previous one stopped instead of starting
+    from the transitional duty with empty integrators. A checkpoint is
+    only used if it is younger than max_age seconds and was written for
+    the same config hash. CLOCK_MONOTONIC is system wide, so the age is
+    still right across fscd restarts.
+    '''
+    def __init__(self, path, config_hash, max_age, clock=monotonic):
+        self.path = path
+        self.config_hash = config_hash
+        self.max_age = max_age
+        self.clock = clock
+
+    def save(self, zones):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'timestamp': self.clock(),
+                       'config_hash': self.config_hash,
+                       'zones': zones}, f)
+        os.rename(tmp, self.path)
+
+    def load(self):
+        '''Returns the saved zone states, or None if there is no usable one'''
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get('config_hash') != self.config_hash:
+            return None
+        age = self.clock() - data.get('timestamp', 0)
+        if age < 0 or age > self.max_age:
+            return None
+        return data['zones']
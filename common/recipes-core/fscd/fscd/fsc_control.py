@@ -1,3 +1,4 @@
+from bisect import bisect_right
 import math
 
 class PID:
@@ -28,6 +29,15 @@ class PID:
         # use most recently calc'd PWM value
         return self.last_out
 
+    def get_state(self):
+        return {'I': self.I, 'last_error': self.last_error,
+                'last_out': self.last_out}
+
+    def set_state(self, state):
+        self.I = state['I']
+        self.last_error = state['last_error']
+        self.last_out = state['last_out']
+
 
 # Threshold table
 class TTable:
@@ -61,3 +71,55 @@ class TTable:
         self.compare_fsc_value=value
         self.last_out = mini
         return mini
+
+    def get_state(self):
+        return {'compare_fsc_value': self.compare_fsc_value,
+                'last_out': self.last_out}
+
+    def set_state(self, state):
+        self.compare_fsc_value = state['compare_fsc_value']
+        self.last_out = state['last_out']
+
+
+# Interpolated threshold table: output is piecewise linear between the
+# breakpoints and flat beyond the first and last one
+class ITable:
+    def __init__(self, table, neg_hyst=0.0, pos_hyst=0.0):
+        table = sorted(table, key=lambda (in_thr, out): in_thr)
+        self.inputs = [in_thr for (in_thr, out) in table]
+        self.outputs = [out for (in_thr, out) in table]
+        self.compare_fsc_value = 0
+        self.last_out = None
+        self.neghyst=neg_hyst
+        self.poshyst=pos_hyst
+
+    def run(self, value, dt):
+        if value >= self.compare_fsc_value:
+            if math.fabs(self.compare_fsc_value-value) <= self.poshyst:
+               return self.last_out
+
+        if value <= self.compare_fsc_value:
+            if math.fabs(self.compare_fsc_value-value) <= self.neghyst:
+               return self.last_out
+
+        i = bisect_right(self.inputs, value)
+        if i == 0:
+            out = self.outputs[0]
+        elif i == len(self.inputs):
+            out = self.outputs[-1]
+        else:
+            (x0, x1) = (self.inputs[i - 1], self.inputs[i])
+            (y0, y1) = (self.outputs[i - 1], self.outputs[i])
+            out = y0 + (y1 - y0) * float(value - x0) / (x1 - x0)
+
+        self.compare_fsc_value=value
+        self.last_out = out
+        return out
+
+    def get_state(self):
+        return {'compare_fsc_value': self.compare_fsc_value,
+                'last_out': self.last_out}
+
+    def set_state(self, state):
+        self.compare_fsc_value = state['compare_fsc_value']
+        self.last_out = state['last_out']
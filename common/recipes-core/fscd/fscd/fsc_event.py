@@ -0,0 +1,134 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+import errno
+import os
+import select
+from fsc_sched import monotonic
+
+
+class GpioWatch:
+    '''
+    A sysfs GPIO value attribute. When the GPIO can interrupt on both edges
+    the fd is polled for POLLPRI; otherwise 'edge' is False and the value
+    has to be sampled.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.edge = False
+        try:
+            with open(os.path.join(os.path.dirname(path), 'edge'), 'w') as f:
+                f.write('both')
+            self.edge = True
+        except IOError:
+            pass
+        self.fd = os.open(path, os.O_RDONLY)
+        self.value = self.read()
+
+    def read(self):
+        # Reading from offset 0 also re-arms the edge notification
+        try:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            return int(os.read(self.fd, 8))
+        except (OSError, ValueError):
+            return None
+
+    def changed(self):
+        value = self.read()
+        if value is None or value == self.value:
+            return False
+        self.value = value
+        return True
+
+
+class EventSource:
+    '''
+    Lets fscd react between ticks. sleep() is used as the scheduler's sleep
+    and returns True as soon as a watched GPIO changes (e.g. the chassis
+    intrusion / tray pull GPIO) or a fan drops below min_rpm, leaving the
+    events in 'events'. GPIOs with edge support are watched with poll();
+    tachs and the other GPIOs are sampled every 'interval' seconds, the
+    last tach sample is kept in 'speeds'.
+    '''
+    def __init__(self, gpio_paths, tach_reader=None, min_rpm=0,
+                 interval=0.5, clock=monotonic):
+        self.tach_reader = tach_reader
+        self.min_rpm = min_rpm
+        self.interval = interval
+        self.clock = clock
+        self.poller = select.poll()
+        self.gpios = {}
+        self.sampled_gpios = []
+        for path in gpio_paths:
+            gpio = GpioWatch(path)
+            if gpio.edge:
+                self.gpios[gpio.fd] = gpio
+                self.poller.register(gpio.fd, select.POLLPRI | select.POLLERR)
+            else:
+                self.sampled_gpios.append(gpio)
+        self.sampling = bool(tach_reader or self.sampled_gpios)
+        self.next_sample = clock() + interval
+        self.slow_fans = set()
+        self.speeds = None
+        self.events = []
+
+    def sample(self):
+        for gpio in self.sampled_gpios:
+            if gpio.changed():
+                self.events.append(('gpio', gpio.path, gpio.value))
+        if not self.tach_reader:
+            return
+        self.speeds = self.tach_reader.read()
+        slow_fans = set()
+        for fan, rpm in self.speeds.items():
+            if rpm < self.min_rpm:
+                slow_fans.add(fan)
+        for fan in sorted(slow_fans - self.slow_fans):
+            self.events.append(('fan', fan, self.speeds[fan]))
+        self.slow_fans = slow_fans
+
+    def sleep(self, seconds):
+        end = self.clock() + seconds
+        while not self.events:
+            now = self.clock()
+            if now >= end:
+                return False
+            timeout = end - now
+            if self.sampling:
+                timeout = min(timeout, max(0, self.next_sample - now))
+            try:
+                ready = self.poller.poll(timeout * 1000)
+            except select.error as e:
+                # e.g. SIGUSR1 asking for a tick log dump
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+            for (fd, event) in ready:
+                gpio = self.gpios[fd]
+                if gpio.changed():
+                    self.events.append(('gpio', gpio.path, gpio.value))
+            if self.sampling and self.clock() >= self.next_sample:
+                self.next_sample = self.clock() + self.interval
+                self.sample()
+        return True
+
+    def take(self):
+        events = self.events
+        self.events = []
+        return events
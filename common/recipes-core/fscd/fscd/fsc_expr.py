@@ -3,8 +3,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from fnmatch import fnmatchcase
 import fsc_parser
+import hashlib
 import json
+import os
 import sys
 
 class InfixNode():
@@ -22,6 +25,12 @@ class InfixNode():
         fv = self.op.apply(lhv, rhv)
         return (fv, "%s %s %s" % (lht, str(self.op), rht))
 
+    def compile(self, scope, cexpr):
+        apply = self.op.apply
+        lhs = self.lhs.compile(scope, cexpr)
+        rhs = self.rhs.compile(scope, cexpr)
+        return lambda env, ctx: apply(lhs(env, ctx), rhs(env, ctx))
+
     def __str__(self):
         return str(self.lhs) + " " + str(self.op) + " " + str(self.rhs)
 
@@ -29,15 +38,43 @@ class ListNode():
     def __init__(self, inners):
         self.inners = inners
 
+    # Groups are spliced into the list rather than nested in it
     def eval(self, ctx):
-        return [i.eval(ctx) for i in self.inners]
+        result = []
+        for i in self.inners:
+            if isinstance(i, GroupNode):
+                result.extend(i.eval(ctx))
+            else:
+                result.append(i.eval(ctx))
+        return result
 
     def dbgeval(self, ctx):
         evals = [i.dbgeval(ctx) for i in self.inners]
-        fvs = [fv for (fv, dt) in evals]
+        fvs = []
+        for (i, (fv, dt)) in zip(self.inners, evals):
+            if isinstance(i, GroupNode):
+                fvs.extend(fv)
+            else:
+                fvs.append(fv)
         dts = [dt for (fv, dt) in evals]
         return (fvs, "[\n " + ",\n " .join(dts) + "]")
 
+    def compile(self, scope, cexpr):
+        inners = tuple(i.compile(scope, cexpr) for i in self.inners)
+        splice = tuple(isinstance(i, GroupNode) for i in self.inners)
+        if not any(splice):
+            return lambda env, ctx: [i(env, ctx) for i in inners]
+        parts = tuple(zip(inners, splice))
+        def run(env, ctx):
+            result = []
+            for (i, group) in parts:
+                if group:
+                    result.extend(i(env, ctx))
+                else:
+                    result.append(i(env, ctx))
+            return result
+        return run
+
     def __str__(self):
         return "[" + ", ".join([str(i) for i in self.inners]) + "]"
 
@@ -59,6 +96,17 @@ class BindNode():
         (ifv, idt) = self.innernode.dbgeval(innerctx)
         return (ifv, "{}[{}] = {};\n{}".format(self.name, bfv, bdt, idt))
 
+    def compile(self, scope, cexpr):
+        bind = self.bindnode.compile(scope, cexpr)
+        slot = cexpr.alloc_slot()
+        innerscope = scope.copy()
+        innerscope[self.name] = slot
+        inner = self.innernode.compile(innerscope, cexpr)
+        def run(env, ctx):
+            env[slot] = bind(env, ctx)
+            return inner(env, ctx)
+        return run
+
     def __str__(self):
         return "{} = {};\n{}".format(
                 self.name,
@@ -76,10 +124,82 @@ class IdentNode():
         fv = ctx.get(self.name, None)
         return (fv, "{}={}".format(self.name, fv))
 
+    def compile(self, scope, cexpr):
+        slot = scope.get(self.name)
+        if slot is None:
+            slot = cexpr.ext_slot(self.name)
+        return lambda env, ctx: env[slot]
+
     def __str__(self):
         return self.name
 
 
+class GroupNode():
+    '''
+    A 'fru:sensor' pattern standing for a list of sensors. The FRU part is
+    expanded against the FRUs fscd knows about when the zone is loaded,
+    the sensor part against what each FRU reports (resolve()). A FRU's
+    sensors are matched again whenever the set it reports changes, e.g.
+    after a partial first read, so sensors can join the group later on.
+    Evaluation only reads the resolved slots.
+    '''
+    def __init__(self, pattern):
+        self.pattern = pattern
+        (self.fru_pattern, self.sensor_pattern) = pattern.split(':', 1)
+        self.frus = []
+        self.seen = {}
+        self.last_keys = {}
+        self.names = []
+        self.slots = []
+        self.cexpr = None
+
+    def expand_frus(self, frus):
+        self.frus = sorted([fru for fru in frus
+                            if fnmatchcase(fru, self.fru_pattern)])
+
+    def resolve(self, sensors):
+        '''
+        Matches the sensors of FRUs whose sensor set changed since the last
+        read, returns the names of the sensors that were added to the group
+        '''
+        new = []
+        for fru in self.frus:
+            readings = sensors.get(fru)
+            if not readings:
+                continue
+            keys = set(readings.keys())
+            if keys == self.last_keys.get(fru):
+                continue
+            self.last_keys[fru] = keys
+            seen = self.seen.setdefault(fru, set())
+            for sname in sorted(keys - seen):
+                if fnmatchcase(sname, self.sensor_pattern):
+                    new.append(fru + ':' + sname)
+            seen |= keys
+        self.names.extend(new)
+        if self.cexpr:
+            for name in new:
+                self.slots.append(self.cexpr.ext_slot(name))
+        return new
+
+    def eval(self, ctx):
+        return [ctx.get(name, None) for name in self.names]
+
+    def dbgeval(self, ctx):
+        fvs = self.eval(ctx)
+        return (fvs, "{}{{{}}}".format(self.pattern, ", ".join(
+            ["{}={}".format(n, fv) for (n, fv) in zip(self.names, fvs)])))
+
+    def compile(self, scope, cexpr):
+        self.cexpr = cexpr
+        self.slots = [cexpr.ext_slot(name) for name in self.names]
+        slots = self.slots
+        return lambda env, ctx: [env[i] for i in slots]
+
+    def __str__(self):
+        return self.pattern
+
+
 class ConstNode():
     def __init__(self, value):
         self.value = value
@@ -88,7 +208,11 @@ class ConstNode():
         return self.value
 
     def dbgeval(self, ctx):
-        return self.value
+        return (self.value, str(self.value))
+
+    def compile(self, scope, cexpr):
+        value = self.value
+        return lambda env, ctx: value
 
     def __str__(self):
         return str(self.value)
@@ -112,6 +236,11 @@ class ApplyNode():
             fv = self.op.apply(iv, ctx)
         return (fv, "{}[{}]({})".format(ft, fv, it))
 
+    def compile(self, scope, cexpr):
+        apply = self.op.apply
+        inner = self.inner.compile(scope, cexpr)
+        return lambda env, ctx: apply(inner(env, ctx), ctx)
+
     def __str__(self):
         return self.name + "(" + str(self.inner) + ")"
 
@@ -132,6 +261,9 @@ def make_apply_node(ast_node, info, profiles):
     applies = {
         'hold': Hold,
         'max': Max,
+        'min': Min,
+        'avg': Avg,
+        'count_valid': CountValid,
     }
     constructor = applies.get(name)
     if constructor:
@@ -158,6 +290,11 @@ def make_bind_node(ast_node, info, profiles):
         info['ext_vars'].remove(name)
     return BindNode(name, bindnode, innernode)
 
+def make_group_node(ast_node, info, profiles):
+    node = GroupNode(ast_node['pattern'])
+    info['groups'].append(node)
+    return node
+
 def make_const_node(ast_node, info, profiles):
     return ConstNode(ast_node['value'])
 
@@ -172,16 +309,138 @@ def make_eval_node(ast_node, info, profiles):
         'bind': make_bind_node,
         'list': make_list_node,
         'const': make_const_node,
+        'group': make_group_node,
     }
     maker = makers.get(ast_node['type'])
     return maker(ast_node, info, profiles)
 
-def make_eval_tree(source, profiles):
-    root_ast_node = fsc_parser.parse_expr(source)
-    info = {'profiles': set(), 'ext_vars': set()}
+def make_eval_tree(source, profiles, cache=None):
+    if cache:
+        root_ast_node = cache.parse(source)
+    else:
+        root_ast_node = fsc_parser.parse_expr(source)
+    info = {'profiles': set(), 'ext_vars': set(), 'groups': []}
     eval_root = make_eval_node(root_ast_node, info, profiles)
     return (eval_root, info)
 
+class CompiledExpr():
+    '''
+    Evaluation tree lowered into nested closures over a flat slot array.
+    External variables and every binding get a fixed slot at compile time,
+    so evaluation no longer copies the context for each 'let'. Operator
+    instances are shared with the tree, so stateful operators (hold,
+    profiles) see the same state from eval() and dbgeval().
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.nslots = 0
+        self.ext_slots = {}
+        self.ext_items = []
+        self.run = root.compile({}, self)
+
+    def alloc_slot(self):
+        slot = self.nslots
+        self.nslots += 1
+        return slot
+
+    def ext_slot(self, name):
+        if name not in self.ext_slots:
+            self.ext_slots[name] = self.alloc_slot()
+            self.ext_items.append((name, self.ext_slots[name]))
+        return self.ext_slots[name]
+
+    def eval(self, ctx):
+        env = [None] * self.nslots
+        for (name, slot) in self.ext_items:
+            env[slot] = ctx.get(name, None)
+        return self.run(env, ctx)
+
+    def dbgeval(self, ctx):
+        return self.root.dbgeval(ctx)
+
+    def __str__(self):
+        return str(self.root)
+
+def compile_eval_tree(eval_root):
+    return CompiledExpr(eval_root)
+
+def stateful_ops(node):
+    '''
+    Returns the operators of a tree that keep state between ticks (profile
+    controllers and hold), always in the same order for the same tree
+    '''
+    if isinstance(node, InfixNode):
+        return stateful_ops(node.lhs) + stateful_ops(node.rhs)
+    if isinstance(node, ListNode):
+        result = []
+        for i in node.inners:
+            result += stateful_ops(i)
+        return result
+    if isinstance(node, BindNode):
+        return stateful_ops(node.bindnode) + stateful_ops(node.innernode)
+    if isinstance(node, ApplyNode):
+        if isinstance(node.op, ApplyProfile):
+            op = [node.op.controller]
+        elif hasattr(node.op, 'get_state'):
+            op = [node.op]
+        else:
+            op = []
+        return op + stateful_ops(node.inner)
+    return []
+
+class ExprCache():
+    '''
+    Parsed zone expressions kept on disk between fscd runs, one file per
+    expression named after a hash of its source and of the profile set
+    (salt), so editing either one simply misses the cache. Failing to read
+    or write the cache is never an error, the source is parsed instead.
+    prune() removes the files of expressions that weren't parsed since the
+    cache was created, so edits don't pile up old entries on flash.
+    '''
+    def __init__(self, path, salt=''):
+        self.path = path
+        self.salt = salt
+        self.used = set()
+
+    def filename(self, source):
+        key = hashlib.sha1((self.salt + '\0' + source).encode('utf-8'))
+        return os.path.join(self.path, key.hexdigest() + '.json')
+
+    def parse(self, source):
+        filename = self.filename(source)
+        self.used.add(os.path.basename(filename))
+        try:
+            with open(filename, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            pass
+        ast = fsc_parser.parse_expr(source)
+        if ast is None:
+            return ast
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            tmp = filename + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(ast, f)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            pass
+        return ast
+
+    def prune(self):
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            if name in self.used:
+                continue
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+
 class InvalidExpression(Exception):
     pass
 
@@ -190,13 +449,17 @@ class Hold():
     def __init__(self):
         self.last = None
     def dbgapply(self, inp, ctx):
-        return (self.apply(inp), "hold[held={}]".format(self.last))
+        return (self.apply(inp, ctx), "hold[held={}]".format(self.last))
     def apply(self, inp, ctx):
         if inp is not None:
             self.last = inp
             return inp
         else:
             return self.last
+    def get_state(self):
+        return {'last': self.last}
+    def set_state(self, state):
+        self.last = state['last']
 
 class Max():
     identity = 0
@@ -207,6 +470,25 @@ class Max():
                 m = i
         return m
 
+class Min():
+    def apply(self, inp, ctx):
+        m = None
+        for i in inp:
+            if i is not None and (m is None or i < m):
+                m = i
+        return m
+
+class Avg():
+    def apply(self, inp, ctx):
+        valid = [i for i in inp if i is not None]
+        if not valid:
+            return None
+        return float(sum(valid)) / len(valid)
+
+class CountValid():
+    def apply(self, inp, ctx):
+        return len([i for i in inp if i is not None])
+
 class ApplyProfile():
     def __init__(self, profile, controller):
         self.profile = profile
@@ -0,0 +1,106 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+import os
+import re
+
+
+class PwmOutputStage:
+    '''
+    Collects the duty cycle every zone wants on each PWM output during a
+    tick and writes them out in one batch with flush(). When several zones
+    drive the same output the highest request wins. Outputs are only
+    written when their value differs from the last one written, except
+    every 'refresh' flushes (0 disables) when all of them are rewritten in
+    case something else touched the fans.
+    '''
+    def __init__(self, refresh=0):
+        self.refresh = refresh
+        self.flushes = 0
+        self.desired = {}
+        self.written = {}
+
+    def request(self, output, pct):
+        if output not in self.desired or pct > self.desired[output]:
+            self.desired[output] = pct
+
+    def invalidate(self):
+        self.written = {}
+
+    def flush(self, write):
+        self.flushes += 1
+        if self.refresh and self.flushes % self.refresh == 0:
+            self.invalidate()
+        changed = []
+        for output in sorted(self.desired.keys()):
+            pct = self.desired[output]
+            if self.written.get(output) == pct:
+                continue
+            write(output, pct)
+            self.written[output] = pct
+            changed.append(output)
+        self.desired = {}
+        return changed
+
+
+def discover_tach_inputs(tach_dir, count=None):
+    '''
+    Returns {fan id: path} for every fanN_input attribute in tach_dir. The
+    fan id is N, counting from 1 like fscd numbers fan-util's readings
+    (fan-util itself prints them from Fan 0). If count is given only fans
+    1..count are used, so disabled tach channels of the PWM/tach controller
+    are not mistaken for dead fans.
+    '''
+    inputs = {}
+    for name in os.listdir(tach_dir):
+        m = re.match(r"^fan(\d+)_input$", name)
+        if m is None:
+            continue
+        fan = int(m.group(1))
+        if count is not None and fan > count:
+            continue
+        inputs[fan] = os.path.join(tach_dir, name)
+    return inputs
+
+
+class TachReader:
+    '''
+    Reads fan tach inputs straight from sysfs. Each attribute is opened once
+    and re-read from offset 0 every tick. A fan whose input can't be read
+    is reported at 0 RPM, so it is treated as dead rather than ignored.
+    '''
+    def __init__(self, inputs):
+        self.fds = {}
+        for fan, path in inputs.items():
+            self.fds[fan] = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        result = {}
+        for fan, fd in self.fds.items():
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                result[fan] = int(os.read(fd, 32))
+            except (OSError, ValueError):
+                result[fan] = 0
+        return result
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
@@ -0,0 +1,10 @@
+# fsc_lextab.py. This file automatically created by PLY (version 3.8). Don't edit!
+_tabversion   = '3.8'
+_lextokens    = set([u'PAR_END', u'GROUP', u'SEMICOLON', u'EQUAL', u'SYM', u'NUM', u'PLUS', u'LIST_END', u'PAR_OPEN', u'LIST_OPEN', u'LIST_SEP'])
+_lexreflags   = 0
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [(u'(?P<t_GROUP>(?:[A-Za-z0-9_*]|\\[!?[0-9,-]+\\])+:(?:[A-Za-z0-9_*]|\\[!?[0-9,-]+\\])+)|(?P<t_NUM>[0-9]+)|(?P<t_SYM>[A-Za-z_][:A-Za-z0-9_]*)|(?P<t_LIST_END>\\])|(?P<t_PLUS>\\+)|(?P<t_PAR_OPEN>\\()|(?P<t_LIST_OPEN>\\[)|(?P<t_PAR_END>\\))|(?P<t_LIST_SEP>,)|(?P<t_EQUAL>=)|(?P<t_SEMICOLON>;)', [None, (u't_GROUP', 'GROUP'), (u't_NUM', 'NUM'), (None, 'SYM'), (None, 'LIST_END'), (None, 'PLUS'), (None, 'PAR_OPEN'), (None, 'LIST_OPEN'), (None, 'PAR_END'), (None, 'LIST_SEP'), (None, 'EQUAL'), (None, 'SEMICOLON')])]}
+_lexstateignore = {'INITIAL': u' \t\n'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
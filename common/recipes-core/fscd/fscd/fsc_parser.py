@@ -5,10 +5,12 @@ from __future__ import unicode_literals
 
 from ply import lex, yacc
 import json
+import os
 import sys
 import logging
 
 tokens = (
+    "GROUP",
     "SYM",
     "NUM",
     "PLUS",
@@ -23,6 +25,15 @@ tokens = (
 
 t_SYM = r"[A-Za-z_][:A-Za-z0-9_]*"
 
+# A group of sensors, 'fru:sensor' with shell style wildcards in either
+# part, e.g. *:soc_temp or slot[1-4]:soc_dimm*. Without any wildcard it is
+# just a symbol.
+def t_GROUP(t):
+    r"(?:[A-Za-z0-9_*]|\[!?[0-9,-]+\])+:(?:[A-Za-z0-9_*]|\[!?[0-9,-]+\])+"
+    if '*' not in t.value and '[' not in t.value:
+        t.type = "SYM"
+    return t
+
 def t_NUM(t):
     r"[0-9]+"
     t.value = int(t.value)
@@ -86,6 +97,10 @@ def p_expression_ident(p):
     "expression : SYM"
     p[0] = {'type': 'ident', 'name': p[1]}
 
+def p_expression_group(p):
+    "expression : GROUP"
+    p[0] = {'type': 'group', 'pattern': p[1]}
+
 def p_expression_const(p):
     "expression : NUM"
     p[0] = {'type': 'const', 'value': p[1]}
@@ -96,8 +111,40 @@ def p_error(p):
     else:
         print("Unexpectedly reached end of input")
 
-lexer = lex.lex(errorlog=yacc.NullLogger())
-parser = yacc.yacc(errorlog=yacc.NullLogger())
+# The lexer and LALR tables are generated ahead of time and installed with
+# fscd as fsc_lextab.py and fsc_parsetab.py, generating them on the BMC
+# delays every fscd start. They must be generated with the ply version the
+# image ships (python-ply 3.8). If a table is missing or was made by another
+# ply version it is not used: the lexer and parser are built in memory and
+# nothing is written back to the install directory. Rerun this file with
+# ply 3.8 after changing the grammar to regenerate them.
+TABLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def table_usable(tabmodule):
+    try:
+        tab = __import__(tabmodule)
+    except ImportError:
+        return False
+    return getattr(tab, '_tabversion', None) == lex.__tabversion__
+
+def make_parser(write_tables=False):
+    optimize = write_tables or table_usable('fsc_lextab')
+    lexer = lex.lex(optimize=optimize, lextab='fsc_lextab',
+                    outputdir=TABLE_DIR, errorlog=yacc.NullLogger())
+    parser = yacc.yacc(tabmodule='fsc_parsetab', outputdir=TABLE_DIR,
+                       debug=False, write_tables=write_tables,
+                       errorlog=yacc.NullLogger())
+    return (lexer, parser)
+
+(lexer, parser) = make_parser()
 
 def parse_expr(s):
-    return parser.parse(s)
+    return parser.parse(s, lexer=lexer)
+
+if __name__ == "__main__":
+    for tab in ['fsc_lextab', 'fsc_parsetab']:
+        sys.modules.pop(tab, None)
+        for ext in ['.py', '.pyc']:
+            if os.path.exists(os.path.join(TABLE_DIR, tab + ext)):
+                os.remove(os.path.join(TABLE_DIR, tab + ext))
+    make_parser(write_tables=True)
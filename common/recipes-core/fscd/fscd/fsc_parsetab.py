@@ -0,0 +1,38 @@
+
+# fsc_parsetab.py
+# This file is automatically generated. Do not edit.
+_tabversion = '3.8'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'AA094BFAAEFBFCC79E3696E0C0B5FB75'
+    
+_lr_action_items = {u'GROUP':([0,4,6,7,10,13,16,],[1,1,1,1,1,1,1,]),u'SEMICOLON':([1,2,3,11,14,15,17,19,],[-8,-7,-9,16,-4,-6,-5,-3,]),u'PAR_OPEN':([2,],[7,]),u'EQUAL':([2,],[6,]),u'SYM':([0,4,6,7,10,13,16,],[2,2,2,2,2,2,2,]),u'NUM':([0,4,6,7,10,13,16,],[3,3,3,3,3,3,3,]),u'PAR_END':([1,2,3,12,14,15,17,19,],[-8,-7,-9,17,-4,-6,-5,-3,]),u'LIST_END':([1,2,3,8,9,14,15,17,18,19,],[-8,-7,-9,14,-2,-4,-6,-5,-1,-3,]),u'PLUS':([1,2,3,5,9,11,12,14,15,17,18,19,],[-8,-7,-9,10,10,10,10,-4,-6,-5,10,10,]),u'LIST_OPEN':([0,4,6,7,10,13,16,],[4,4,4,4,4,4,4,]),u'LIST_SEP':([1,2,3,8,9,14,15,17,18,19,],[-8,-7,-9,13,-2,-4,-6,-5,-1,-3,]),'$end':([1,2,3,5,14,15,17,19,],[-8,-7,-9,0,-4,-6,-5,-3,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {u'list_elements':([4,],[8,]),u'expression':([0,4,6,7,10,13,16,],[5,9,11,12,15,18,19,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> expression","S'",1,None,None,None),
+  (u'list_elements -> list_elements LIST_SEP expression',u'list_elements',3,'p_list_elements','fsc_parser.py',63),
+  (u'list_elements -> expression',u'list_elements',1,'p_list_elements_tail','fsc_parser.py',67),
+  (u'expression -> SYM EQUAL expression SEMICOLON expression',u'expression',5,'p_expression_binding','fsc_parser.py',71),
+  (u'expression -> LIST_OPEN list_elements LIST_END',u'expression',3,'p_expression_list','fsc_parser.py',79),
+  (u'expression -> SYM PAR_OPEN expression PAR_END',u'expression',4,'p_expression_apply','fsc_parser.py',84),
+  (u'expression -> expression PLUS expression',u'expression',3,'p_expression_binop','fsc_parser.py',90),
+  (u'expression -> SYM',u'expression',1,'p_expression_ident','fsc_parser.py',97),
+  (u'expression -> GROUP',u'expression',1,'p_expression_group','fsc_parser.py',101),
+  (u'expression -> NUM',u'expression',1,'p_expression_const','fsc_parser.py',105),
+]
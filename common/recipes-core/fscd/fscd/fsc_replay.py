@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Replays a sensor/tach trace (see fsc_trace.py) recorded by fscd through an
+# fscd config and its zone files, without any BMC hardware. Time is
+# simulated, so a trace runs as fast as the CPU allows. Prints the PWM
+# timeline as JSON lines and a throughput summary on stderr, e.g.:
+#
+#   fsc_replay.py -o timeline.json config.json trace.json
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import fscd
+from fsc_fan import PwmOutputStage
+from fsc_sched import Scheduler
+from fsc_trace import read_trace
+
+
+class VirtualClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ReplayMachine:
+    '''Stands in for fscd's BMCMachine, serving readings from a trace'''
+    def __init__(self, records):
+        self.records = records
+        self.index = 0
+        self.pwm = {}
+        self.fru_read_times = {}
+
+    def seek(self, t):
+        # Sample and hold: use the newest record not later than t
+        while (self.index + 1 < len(self.records) and
+               self.records[self.index + 1][0] <= t):
+            self.index += 1
+
+    def read_sensors(self, frus=None):
+        (t, sensors, speeds) = self.records[self.index]
+        if frus is None:
+            return sensors
+        result = {}
+        for fru in frus:
+            result[fru] = sensors.get(fru, {})
+        return result
+
+    def read_speed(self):
+        return self.records[self.index][2]
+
+    def set_pwm(self, pwm, pct):
+        self.pwm[pwm] = pct
+
+    def set_all_pwm(self, pct):
+        for pwm in self.pwm.keys():
+            self.pwm[pwm] = pct
+
+    def fan_dead(self, fan):
+        pass
+
+    def fan_recovered(self, fan):
+        pass
+
+    def chassis_intrusion(self):
+        return 0
+
+
+def replay(config, zone_dir, records, out=None):
+    '''
+    Runs the zones of config over records and returns (ticks, zone runs).
+    Writes one JSON line per tick to out, if given.
+    '''
+    fscd.apply_config(config)
+    # Don't leave parsed expressions from a workstation in /mnt/data
+    frus = set()
+    for (t, sensors, speeds) in records:
+        frus |= set(sensors.keys())
+    zones = fscd.load_zones(dict(config, expr_cache_dir=None), zone_dir,
+                            sorted(frus))
+    machine = ReplayMachine(records)
+    stage = PwmOutputStage()
+    interval = config['sample_interval_ms'] / 1000.0
+    t0 = records[0][0]
+    end = records[-1][0]
+    vclock = VirtualClock(t0 - interval)
+    sched = Scheduler(clock=vclock.clock, sleep=vclock.sleep)
+    for zone in zones:
+        sched.add(zone, zone.interval, interval)
+    dead_fans = set()
+    ticks = 0
+    runs = 0
+    while True:
+        due = sched.wait()
+        if vclock.now > end:
+            break
+        machine.seek(vclock.now)
+        frus = set()
+        for (zone, dt) in due:
+            frus |= zone.frus
+        sensors = machine.read_sensors(frus)
+        speeds = machine.read_speed()
+        fscd.update_dead_fans(machine, speeds, dead_fans, config['min_rpm'])
+        for (zone, dt) in due:
+            fscd.zone_pwm(zone, sensors, dt, dead_fans, 0)
+        fscd.request_zone_outputs(zones, stage)
+        stage.flush(machine.set_pwm)
+        ticks += 1
+        runs += len(due)
+        if out:
+            zone_pwms = {}
+            for zone in zones:
+                zone_pwms[zone.name] = zone.last_pwm
+            out.write(json.dumps({'t': vclock.now - t0,
+                                  'zones': zone_pwms,
+                                  'outputs': machine.pwm,
+                                  'dead_fans': sorted(dead_fans)},
+                                 sort_keys=True))
+            out.write('\n')
+    return (ticks, runs)
+
+
+def repeat_records(records, count):
+    '''Concatenates count copies of records, shifted in time'''
+    if count <= 1:
+        return records
+    span = records[-1][0] - records[0][0]
+    if len(records) > 1:
+        span += (records[-1][0] - records[0][0]) / (len(records) - 1)
+    result = []
+    for i in range(count):
+        for (t, sensors, speeds) in records:
+            result.append((t + i * span, sensors, speeds))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Replay a recorded sensor trace through fscd zones')
+    parser.add_argument('config', help='fscd config (fsc-config.json)')
+    parser.add_argument('trace', help='trace recorded by fscd (trace_file)')
+    parser.add_argument('-z', '--zone-dir',
+                        help='directory of the zone expression files '
+                             '(default: directory of the config)')
+    parser.add_argument('-o', '--output',
+                        help='PWM timeline output (default: stdout)')
+    parser.add_argument('-n', '--repeat', type=int, default=1,
+                        help='replay the trace N times back to back')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    zone_dir = args.zone_dir
+    if zone_dir is None:
+        zone_dir = os.path.dirname(os.path.abspath(args.config))
+    records = repeat_records(read_trace(args.trace), args.repeat)
+    if not records:
+        sys.exit('%s: empty trace' % (args.trace,))
+
+    if args.output:
+        out = open(args.output, 'w')
+    else:
+        out = sys.stdout
+    # fscd's own console output would swamp the timeline, drop it
+    fscd.log_to_syslog = False
+    fscd.quiet = True
+    start = time.time()
+    (ticks, runs) = replay(config, zone_dir, records, out)
+    elapsed = time.time() - start
+    if out is not sys.stdout:
+        out.close()
+    sys.stderr.write('%d ticks, %d zone runs in %.3f s: '
+                     '%.0f ticks/s, %.0f zone runs/s\n' %
+                     (ticks, runs, elapsed,
+                      ticks / max(elapsed, 1e-9), runs / max(elapsed, 1e-9)))
+
+if __name__ == "__main__":
+    main()
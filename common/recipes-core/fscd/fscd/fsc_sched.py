@@ -0,0 +1,101 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+from ctypes import *
+import time
+
+CLOCK_MONOTONIC = 1
+
+class timespec(Structure):
+    _fields_ = [('tv_sec', c_long), ('tv_nsec', c_long)]
+
+def find_clock_gettime():
+    for lib in [None, 'librt.so.1']:
+        try:
+            return CDLL(lib).clock_gettime
+        except (OSError, AttributeError):
+            continue
+    return None
+
+_clock_gettime = find_clock_gettime()
+
+def monotonic():
+    '''Seconds from CLOCK_MONOTONIC, or wall time if it isn't available'''
+    if _clock_gettime is None:
+        return time.time()
+    ts = timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, pointer(ts)):
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+class PeriodicTask:
+    def __init__(self, obj, interval, deadline):
+        self.obj = obj
+        self.interval = interval
+        self.deadline = deadline
+        self.last = deadline - interval
+
+
+class Scheduler:
+    '''
+    Runs objects at fixed rates on absolute deadlines. Deadlines advance by
+    whole periods, so time spent doing the work does not add up into
+    drift. If the caller falls behind by one or more full periods the
+    missed runs are skipped rather than run back to back, and reported in
+    'overruns' as (object, periods skipped). A sleep function that returns
+    True has been interrupted by an event, wait() then returns early.
+    '''
+    def __init__(self, clock=monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = []
+        self.overruns = []
+
+    def add(self, obj, interval, first=None):
+        if first is None:
+            first = interval
+        self.tasks.append(PeriodicTask(obj, interval, self.clock() + first))
+
+    def wait(self):
+        '''
+        Sleeps until at least one object is due and returns a list of
+        (object, dt) for every due object, dt being the time since it last
+        ran. Returns an empty list if the sleep was interrupted.
+        '''
+        self.overruns = []
+        while True:
+            now = self.clock()
+            deadline = min([t.deadline for t in self.tasks])
+            if deadline > now:
+                if self.sleep(deadline - now):
+                    return []
+                now = self.clock()
+            due = []
+            for t in self.tasks:
+                if t.deadline > now:
+                    continue
+                missed = int((now - t.deadline) / t.interval)
+                if missed:
+                    self.overruns.append((t.obj, missed))
+                t.deadline += (missed + 1) * t.interval
+                due.append((t.obj, now - t.last))
+                t.last = now
+            if due:
+                return due
@@ -0,0 +1,359 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+from collections import namedtuple
+from subprocess import Popen, PIPE
+import Queue
+import re
+import threading
+from lib_pal import *
+from fsc_sched import monotonic
+
+SensorValue = namedtuple('SensorValue', ['id','name','value','unit','status'])
+
+# Order matters: later matches override earlier ones, as in sensor-util
+UPPER_THRESHOLDS = ['unc', 'ucr', 'unr']
+LOWER_THRESHOLDS = ['lnc', 'lcr', 'lnr']
+
+def bmc_symbolize_sensorname(name):
+    return name.lower().replace(" ", "_")
+
+# BAD. Lifted from REST API and patched up a bit
+# TODO: add a --json to sensor-util
+
+def bmc_sensor_read(fru):
+    result = {}
+    cmd = '/usr/local/bin/sensor-util ' + fru
+    data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
+    sdata = data.split('\n')
+    for line in sdata:
+        # skip lines with " or startin with FRU
+        if line.find("bic_read_sensor_wrapper") != -1:
+            continue
+        if line.find("failed") != -1:
+            continue
+
+        if line.find(" NA "):
+            m = re.match(r"^(.*)\((0x..?)\)\s+:\s+([^\s]+)\s+.\s+\((.+)\)$", line)
+            if m is not None:
+                sid = int(m.group(2), 16)
+                name = m.group(1).strip()
+                value = None
+                status = m.group(4)
+                symname = bmc_symbolize_sensorname(name)
+                result[symname] = SensorValue(sid, name, value, None, status)
+                continue
+        m = re.match(r"^(.*)\((0x..?)\)\s+:\s+([^\s]+)\s+([^\s]+)\s+.\s+\((.+)\)$", line)
+        if m is not None:
+            sid = int(m.group(2), 16)
+            name = m.group(1).strip()
+            value = float(m.group(3))
+            unit = m.group(4)
+            status = m.group(5)
+            symname = bmc_symbolize_sensorname(name)
+            result[symname] = SensorValue(sid, name, value, unit, status)
+    return result
+
+def bmc_sensor_read_thresholds(fru):
+    '''
+    Runs 'sensor-util <fru> --threshold' once and returns a tuple of
+    (readings, thresholds): readings is the same dict bmc_sensor_read()
+    returns, thresholds maps the symbolic sensor name to a dict of the
+    thresholds sensor-util knows about (e.g. {'ucr': 40.0}), or to None for
+    sensors that read NA, as sensor-util does not print their thresholds.
+    '''
+    readings = {}
+    thresholds = {}
+    cmd = '/usr/local/bin/sensor-util ' + fru + ' --threshold'
+    data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
+    for line in data.split('\n'):
+        if line.find("bic_read_sensor_wrapper") != -1:
+            continue
+        if line.find("failed") != -1:
+            continue
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) < 2:
+            continue
+        m = re.match(r"^(.*)\((0x..?)\)\s+:\s+([^\s]+)\s*([^\s]*)$", fields[0])
+        s = re.match(r"^\((.+)\)$", fields[1])
+        if m is None or s is None:
+            continue
+        sid = int(m.group(2), 16)
+        name = m.group(1).strip()
+        symname = bmc_symbolize_sensorname(name)
+        if m.group(3) == 'NA':
+            readings[symname] = SensorValue(sid, name, None, None, s.group(1))
+            thresholds[symname] = None
+            continue
+        readings[symname] = SensorValue(sid, name, float(m.group(3)),
+                                        m.group(4) or None, s.group(1))
+        limits = {}
+        for field in fields[2:]:
+            kv = field.split(':')
+            if len(kv) != 2 or kv[1].strip() == 'NA':
+                continue
+            limits[kv[0].strip().lower()] = float(kv[1])
+        thresholds[symname] = limits
+    return (readings, thresholds)
+
+def sensor_status(value, thresholds):
+    if not thresholds:
+        status = 'ns'
+    else:
+        status = 'ok'
+    for t in UPPER_THRESHOLDS:
+        if t in thresholds and value >= thresholds[t]:
+            status = t
+    for t in LOWER_THRESHOLDS:
+        if t in thresholds and value <= thresholds[t]:
+            status = t
+    return status
+
+
+class SensorUtilBackend:
+    '''Reads every sensor of a FRU by forking sensor-util'''
+    name = 'sensor-util'
+
+    def read(self, fru):
+        return bmc_sensor_read(fru)
+
+
+class PalSensorBackend:
+    '''
+    Reads sensors in-process through libpal. The sensor ids, names, units
+    and thresholds of a FRU are learnt from a single sensor-util run the
+    first time the FRU is read; after that each tick only costs one
+    pal_sensor_read() call per sensor.
+
+    sensor-util does not report the unit and thresholds of a sensor that
+    reads NA. Such a sensor is read through sensor-util again as soon as
+    libpal returns a value for it, and a FRU is re-discovered every
+    'refresh' reads to pick up sensors that appeared later. Units and
+    thresholds that were learnt once are kept when a sensor reads NA during
+    a later discovery.
+    '''
+    name = 'libpal'
+
+    def __init__(self, refresh=60):
+        self.refresh = refresh
+        self.fru_ids = {}
+        self.sensors = {}
+        self.reads = {}
+
+    def discover(self, fru):
+        fru_id = pal_get_fru_id(fru)
+        (readings, thresholds) = bmc_sensor_read_thresholds(fru)
+        # FRU may be absent or not ready yet, try again on the next read
+        if fru_id is None or not readings:
+            return readings
+        known = dict((s[0], s) for s in self.sensors.get(fru, []))
+        sensors = []
+        for symname, v in readings.items():
+            unit = v.unit
+            limits = thresholds[symname]
+            if limits is None and symname in known:
+                (unit, limits) = known[symname][3:]
+            sensors.append((symname, v.id, v.name, unit, limits))
+        self.fru_ids[fru] = fru_id
+        self.sensors[fru] = sensors
+        self.reads[fru] = 0
+        return readings
+
+    def read(self, fru):
+        if fru not in self.sensors or self.reads[fru] >= self.refresh:
+            return self.discover(fru)
+        self.reads[fru] += 1
+        result = {}
+        fru_id = self.fru_ids[fru]
+        for (symname, sid, name, unit, thresholds) in self.sensors[fru]:
+            value = pal_sensor_read(fru_id, sid)
+            if value is None:
+                result[symname] = SensorValue(sid, name, None, None, 'na')
+                continue
+            if thresholds is None:
+                # Came up since the last discovery, learn its thresholds
+                return self.discover(fru)
+            result[symname] = SensorValue(sid, name, value, unit,
+                                          sensor_status(value, thresholds))
+        return result
+
+
+class ConcurrentSensorReader:
+    '''
+    Reads FRUs in parallel on a fixed pool of worker threads. Every FRU has a
+    deadline relative to the start of read(); a FRU that misses it is
+    reported as empty (all of its sensors missing) instead of stalling the
+    control loop. A FRU whose previous read is still running is not queued
+    again, so a hung FRU ties up at most one worker.
+    '''
+    def __init__(self, backend, workers, deadline, fru_deadlines=None):
+        self.backend = backend
+        self.deadline = deadline
+        if fru_deadlines is None:
+            self.fru_deadlines = {}
+        else:
+            self.fru_deadlines = fru_deadlines
+        self.jobs = Queue.Queue()
+        self.results = Queue.Queue()
+        self.busy = set()
+        self.late = set()
+        self.read_times = {}
+        self.tick = 0
+        for i in range(workers):
+            t = threading.Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+
+    def worker(self):
+        while True:
+            (tick, fru) = self.jobs.get()
+            start = monotonic()
+            try:
+                value = self.backend.read(fru)
+            except Exception:
+                value = {}
+            self.results.put((tick, fru, value, monotonic() - start))
+
+    def read(self, frus):
+        self.read_times = {}
+        # Free up FRUs whose late reads have completed since the last tick
+        while True:
+            try:
+                (tick, fru, value, elapsed) = self.results.get(False)
+            except Queue.Empty:
+                break
+            self.busy.discard(fru)
+            self.read_times[fru] = elapsed
+        self.tick += 1
+        start = monotonic()
+        pending = {}
+        for fru in frus:
+            if fru in self.busy:
+                continue
+            self.busy.add(fru)
+            pending[fru] = start + self.fru_deadlines.get(fru, self.deadline)
+            self.jobs.put((self.tick, fru))
+        sensors = {}
+        while pending:
+            timeout = max(pending.values()) - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                (tick, fru, value, elapsed) = self.results.get(True, timeout)
+            except Queue.Empty:
+                break
+            self.busy.discard(fru)
+            self.read_times[fru] = elapsed
+            # Results of reads that missed an earlier tick are dropped
+            if tick != self.tick or fru not in pending:
+                continue
+            if monotonic() <= pending.pop(fru):
+                sensors[fru] = value
+        self.late = set(frus) - set(sensors.keys())
+        for fru in self.late:
+            sensors[fru] = {}
+        return sensors
+
+
+def fru_read_ok(readings):
+    '''A read is good if at least one sensor of the FRU has a value'''
+    for v in readings.values():
+        if v.value is not None:
+            return True
+    return False
+
+
+class FruBreaker:
+    '''
+    Per-FRU circuit breaker. After 'failures' bad reads in a row (nothing
+    but missing or NA sensors) a FRU is tripped and only probed again after
+    'backoff' seconds, doubling after every failed probe up to
+    'max_backoff'. A tripped or failing FRU is served its last good
+    readings for up to 'stale' seconds, then as empty (all sensors
+    missing). The first good read closes the breaker again. FRUs that
+    changed state during update() are listed in 'tripped' and 'restored'.
+    '''
+    def __init__(self, failures=3, backoff=10.0, max_backoff=60.0, stale=0,
+                 clock=monotonic):
+        self.failures = failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stale = stale
+        self.clock = clock
+        self.fails = {}
+        self.delay = {}
+        self.next_probe = {}
+        self.last_good = {}
+        self.tripped = []
+        self.restored = []
+
+    def is_open(self, fru):
+        return fru in self.next_probe
+
+    def filter(self, frus):
+        '''Returns the FRUs that should actually be read now'''
+        now = self.clock()
+        return [fru for fru in frus
+                if fru not in self.next_probe or now >= self.next_probe[fru]]
+
+    def serve(self, fru, readings, now):
+        if fru in self.last_good:
+            (t, good) = self.last_good[fru]
+            if now - t <= self.stale:
+                return good
+        return readings
+
+    def update(self, frus, sensors):
+        '''
+        Takes the readings of the FRUs that were read (sensors) and returns
+        what to use for all of frus
+        '''
+        now = self.clock()
+        self.tripped = []
+        self.restored = []
+        result = {}
+        for fru in frus:
+            if fru not in sensors:
+                result[fru] = self.serve(fru, {}, now)
+                continue
+            readings = sensors[fru]
+            if fru_read_ok(readings):
+                if fru in self.next_probe:
+                    del self.next_probe[fru]
+                    self.restored.append(fru)
+                self.fails[fru] = 0
+                self.last_good[fru] = (now, readings)
+                result[fru] = readings
+                continue
+            self.fails[fru] = self.fails.get(fru, 0) + 1
+            if fru in self.next_probe:
+                self.delay[fru] = min(self.delay[fru] * 2, self.max_backoff)
+                self.next_probe[fru] = now + self.delay[fru]
+            elif self.fails[fru] >= self.failures:
+                self.delay[fru] = self.backoff
+                self.next_probe[fru] = now + self.delay[fru]
+                self.tripped.append(fru)
+            result[fru] = self.serve(fru, readings, now)
+        return result
+
+
+def make_sensor_backend(name):
+    if name == PalSensorBackend.name and pal_sensor_read_supported():
+        return PalSensorBackend()
+    return SensorUtilBackend()
@@ -0,0 +1,69 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+
+# Publishes the sensor readings fscd takes every tick so that other BMC
+# services can use them instead of running sensor-util (and hitting the
+# same I2C devices) again. Readers only depend on the file format, e.g.
+# sensor_snapshot.py in rest-api:
+#
+#   {"version": 1, "frus": {fru: {"timestamp": <time of the read>,
+#     "sensors": {sym: {"id", "name", "value", "unit", "status"}}}}}
+
+import json
+import os
+import time
+
+SNAPSHOT_FILE = '/tmp/fscd_sensors.json'
+SNAPSHOT_VERSION = 1
+
+
+class SensorSnapshot:
+    '''
+    Latest readings of every FRU fscd reads, each with the wall clock time
+    the FRU was read. update() only takes FRUs that were actually read; a
+    FRU that fails, misses its deadline or is served stale readings by the
+    breaker keeps its last readings and timestamp, readers decide how old
+    is too old.
+    publish() replaces the file atomically, so readers never need to lock.
+    '''
+    def __init__(self, path=SNAPSHOT_FILE):
+        self.path = path
+        self.frus = {}
+
+    def update(self, sensors, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        for fru, values in sensors.items():
+            if not values:
+                continue
+            readings = {}
+            for symname, v in values.items():
+                readings[symname] = dict(v._asdict())
+            self.frus[fru] = {'timestamp': timestamp, 'sensors': readings}
+
+    def publish(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': SNAPSHOT_VERSION,
+                       'pid': os.getpid(),
+                       'timestamp': time.time(),
+                       'frus': self.frus}, f)
+        os.rename(tmp, self.path)
+
@@ -0,0 +1,113 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+from collections import deque
+import json
+import os
+import time
+
+
+class RollingStats:
+    '''Keeps the last 'window' samples of a latency series'''
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        s = sorted(self.samples)
+        n = len(s)
+        return {
+            'count': self.count,
+            'last_ms': self.samples[-1] * 1000,
+            'p50_ms': s[(n - 1) // 2] * 1000,
+            'p99_ms': s[min(n - 1, int(n * 0.99))] * 1000,
+            'max_ms': s[-1] * 1000,
+        }
+
+
+class LoopStats:
+    '''
+    Rolling latency statistics for the fscd control loop, grouped by kind
+    ('phase', 'fru_read', 'zone_eval', ...). dump() rewrites the stats file
+    atomically so it can be read at any time without locking.
+    '''
+    def __init__(self, path, window=100):
+        self.path = path
+        self.window = window
+        self.series = {}
+        self.counters = {}
+
+    def record(self, kind, name, seconds):
+        if kind not in self.series:
+            self.series[kind] = {}
+        if name not in self.series[kind]:
+            self.series[kind][name] = RollingStats(self.window)
+        self.series[kind][name].add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        result = {'timestamp': time.time(), 'counters': self.counters}
+        for kind, names in self.series.items():
+            result[kind] = {}
+            for name, stats in names.items():
+                result[kind][name] = stats.summary()
+        return result
+
+    def dump(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+
+class TickLog:
+    '''
+    The last 'size' ticks of the control loop kept in memory, so a quiet
+    fscd can still show what it did recently. dump() writes them out
+    atomically as JSON lines, oldest first.
+    '''
+    def __init__(self, path, size=200):
+        self.path = path
+        self.ticks = deque(maxlen=size)
+
+    def record(self, tick):
+        self.ticks.append(tick)
+
+    def dump(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for tick in list(self.ticks):
+                f.write(json.dumps(tick, sort_keys=True))
+                f.write('\n')
+        os.rename(tmp, self.path)
+
+
+def read_stats(path):
+    '''Returns the last stats snapshot fscd wrote, or None'''
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
@@ -0,0 +1,78 @@
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Sensor/tach traces are JSON lines, one per control loop tick:
+#
+#   {"t": 1234.5,
+#    "sensors": {"slot1": {"soc_temp": [52.0, "ok"], ...}, ...},
+#    "speeds": {"1": 5200, "2": 5150}}
+#
+# "t" is in seconds and only differences between records matter.
+
+import json
+import os
+from fsc_sensor import SensorValue
+
+
+class TraceRecorder:
+    '''
+    Appends one trace record per tick. When the file grows beyond max_bytes
+    it is moved to <path>.1 and a new one is started.
+    '''
+    def __init__(self, path, max_bytes=4194304):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.f = open(path, 'a')
+
+    def record(self, t, sensors, speeds):
+        snap = {}
+        for fru, values in sensors.items():
+            snap[fru] = {}
+            for sname, v in values.items():
+                snap[fru][sname] = [v.value, v.status]
+        self.f.write(json.dumps({'t': t, 'sensors': snap, 'speeds': speeds}))
+        self.f.write('\n')
+        self.f.flush()
+        if self.max_bytes and self.f.tell() > self.max_bytes:
+            self.f.close()
+            os.rename(self.path, self.path + '.1')
+            self.f = open(self.path, 'a')
+
+
+def parse_trace_record(line):
+    rec = json.loads(line)
+    sensors = {}
+    for fru, values in rec.get('sensors', {}).items():
+        sensors[fru] = {}
+        for sname, (value, status) in values.items():
+            sensors[fru][sname] = SensorValue(None, sname, value, None, status)
+    speeds = {}
+    for fan, rpm in rec.get('speeds', {}).items():
+        speeds[int(fan)] = rpm
+    return (rec['t'], sensors, speeds)
+
+
+def read_trace(path):
+    '''Returns the records of a trace file as (t, sensors, speeds) tuples'''
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                records.append(parse_trace_record(line))
+    return records
@@ -30,58 +30,31 @@ import re
 import signal
 from lib_pal import *
 
-from fsc_control import PID, TTable
+from fsc_checkpoint import Checkpoint, CHECKPOINT_FILE, config_hash
+from fsc_control import PID, TTable, ITable
+from fsc_event import EventSource
+from fsc_fan import PwmOutputStage, TachReader, discover_tach_inputs
+from fsc_sensor import SensorValue, SensorUtilBackend, ConcurrentSensorReader
+from fsc_sensor import make_sensor_backend, FruBreaker, fru_read_ok
+from fsc_sched import Scheduler, monotonic
+from fsc_snapshot import SensorSnapshot, SNAPSHOT_FILE
+from fsc_stats import LoopStats, TickLog
+from fsc_trace import TraceRecorder
 import fsc_expr
 
 RAMFS_CONFIG = '/etc/fsc-config.json'
 CONFIG_DIR = '/etc/fsc'
+STATS_FILE = '/tmp/fscd_stats.json'
+TICK_LOG_FILE = '/tmp/fscd_ticks.json'
+EXPR_CACHE_DIR = '/mnt/data/fscd/expr_cache'
 
 boost = 100
 boost_type = 'default'
 transitional = 70
 ramp_rate = 10
 verbose = "-v" in sys.argv
-
-SensorValue = namedtuple('SensorValue', ['id','name','value','unit','status'])
-
-def bmc_symbolize_sensorname(name):
-    return name.lower().replace(" ", "_")
-
-# BAD. Lifted from REST API and patched up a bit
-# TODO: add a --json to sensor-util
-
-def bmc_sensor_read(fru):
-    result = {}
-    cmd = '/usr/local/bin/sensor-util ' + fru
-    data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
-    sdata = data.split('\n')
-    for line in sdata:
-        # skip lines with " or startin with FRU
-        if line.find("bic_read_sensor_wrapper") != -1:
-            continue
-        if line.find("failed") != -1:
-            continue
-
-        if line.find(" NA "):
-            m = re.match(r"^(.*)\((0x..?)\)\s+:\s+([^\s]+)\s+.\s+\((.+)\)$", line)
-            if m is not None:
-                sid = int(m.group(2), 16)
-                name = m.group(1).strip()
-                value = None
-                status = m.group(4)
-                symname = bmc_symbolize_sensorname(name)
-                result[symname] = SensorValue(sid, name, value, None, status)
-                continue
-        m = re.match(r"^(.*)\((0x..?)\)\s+:\s+([^\s]+)\s+([^\s]+)\s+.\s+\((.+)\)$", line)
-        if m is not None:
-            sid = int(m.group(2), 16)
-            name = m.group(1).strip()
-            value = float(m.group(3))
-            unit = m.group(4)
-            status = m.group(5)
-            symname = bmc_symbolize_sensorname(name)
-            result[symname] = SensorValue(sid, name, value, unit, status)
-    return result
+quiet = "-q" in sys.argv
+log_to_syslog = True
 
 def bmc_read_speed():
     cmd = '/usr/local/bin/fan-util --get'
@@ -99,45 +72,104 @@ def bmc_read_speed():
 class BMCMachine:
     def __init__(self):
         self.frus = set()
+        self.sensor_backend = SensorUtilBackend()
+        self.sensor_reader = None
+        self.tach_reader = None
+        self.breaker = None
+        self.fru_read_times = {}
+        self.fresh = set()
+        self.late = set()
     def set_pwm(self, pwm, pct):
-        print("Set pwm %d to %d" % (pwm, pct))
+        console("Set pwm %d to %d" % (pwm, pct))
+        if pal_set_fan_speed_supported():
+            if pal_set_fan_speed(pwm, int(pct)) is None:
+                raise Exception("pal_set_fan_speed(%d, %d) failed" % (pwm, pct))
+            return
         cmd = ('/usr/local/bin/fan-util --set %d %d' % (pct, pwm))
         response = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
         if response.find("Setting") == -1:
             raise Exception(response)
     def set_all_pwm(self, pct):
-        print("Set all pwm to %d" % (pct))
+        console("Set all pwm to %d" % (pct))
         cmd = ('/usr/local/bin/fan-util --set %d' % (pct))
         response = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
         if response.find("Setting") == -1:
             raise Exception(response)
+    def fan_dead(self, fan):
+        pal_fan_dead_handle(fan)
+    def fan_recovered(self, fan):
+        pal_fan_recovered_handle(fan)
+    def chassis_intrusion(self):
+        return pal_fan_chassis_intrusion_handle()
     def read_speed(self):
+        if self.tach_reader:
+            return self.tach_reader.read()
         return bmc_read_speed()
-    def read_sensors(self):
+    def read_sensors(self, frus=None):
+        if frus is None:
+            frus = self.frus
+        if self.breaker:
+            sensors = self.read_frus(self.breaker.filter(frus))
+        else:
+            sensors = self.read_frus(frus)
+        # FRUs actually read this tick, as opposed to served stale readings
+        self.fresh = set(fru for fru in sensors if fru_read_ok(sensors[fru]))
+        if not self.breaker:
+            return sensors
+        sensors = self.breaker.update(frus, sensors)
+        for fru in self.breaker.tripped:
+            warn('FRU %s failed %d reads in a row, backing off' %
+                 (fru, self.breaker.failures))
+        for fru in self.breaker.restored:
+            info('FRU %s is readable again' % (fru,))
+        return sensors
+    def read_frus(self, frus):
+        if self.sensor_reader:
+            sensors = self.sensor_reader.read(frus)
+            self.fru_read_times = self.sensor_reader.read_times
+            late = self.sensor_reader.late & set(frus)
+            if late - self.late:
+                warn('Sensor read deadline missed: %s' %
+                     (', '.join(late),))
+            self.late = late
+            return sensors
         sensors = {}
-        for fru in self.frus:
-            sensors[fru] = bmc_sensor_read(fru)
+        self.fru_read_times = {}
+        for fru in frus:
+            start = monotonic()
+            sensors[fru] = self.sensor_backend.read(fru)
+            self.fru_read_times[fru] = monotonic() - start
         return sensors
 
 machine = BMCMachine()
+pwm_stage = PwmOutputStage()
+tick_log = None
+def console(msg):
+    if not quiet:
+        print(msg)
+
 def info(msg):
-    print("INFO: " + msg)
-    syslog.syslog(syslog.LOG_INFO, msg)
+    console("INFO: " + msg)
+    if log_to_syslog:
+        syslog.syslog(syslog.LOG_INFO, msg)
 
 def debug(msg):
-    print("DEBUG: " + msg)
+    console("DEBUG: " + msg)
 
 def warn(msg):
-    print("WARNING: " + msg)
-    syslog.syslog(syslog.LOG_WARNING, msg)
+    console("WARNING: " + msg)
+    if log_to_syslog:
+        syslog.syslog(syslog.LOG_WARNING, msg)
 
 def error(msg):
-    print("ERROR: " + msg)
-    syslog.syslog(syslog.LOG_ERR, msg)
+    console("ERROR: " + msg)
+    if log_to_syslog:
+        syslog.syslog(syslog.LOG_ERR, msg)
 
 def crit(msg):
-    print("CRITICAL: " + msg)
-    syslog.syslog(syslog.LOG_CRIT, msg)
+    console("CRITICAL: " + msg)
+    if log_to_syslog:
+        syslog.syslog(syslog.LOG_CRIT, msg)
 
 def make_controller(profile):
     if profile['type'] == 'linear':
@@ -146,6 +178,12 @@ def make_controller(profile):
                 profile.get('negative_hysteresis', 0),
                 profile.get('positive_hysteresis', 0))
         return controller
+    if profile['type'] == 'interpolated':
+        controller = ITable(
+                profile['data'],
+                profile.get('negative_hysteresis', 0),
+                profile.get('positive_hysteresis', 0))
+        return controller
     if profile['type'] == 'pid':
         controller = PID(
                 profile['setpoint'],
@@ -167,44 +205,87 @@ def clamp(v, minv, maxv):
     return v
 
 class Zone:
-    def __init__(self, pwm_output, expr, expr_meta):
+    def __init__(self, pwm_output, expr, expr_meta, name=None, interval=None):
         self.pwm_output = pwm_output
         self.last_pwm = transitional
         self.expr = expr
         self.expr_meta = expr_meta
         self.expr_str = str(expr)
+        self.name = name
+        self.interval = interval
+        self.inputs = []
+        self.add_inputs(expr_meta['ext_vars'])
+        self.groups = list(expr_meta.get('groups', []))
+        self.frus = set([board for (v, board, sname) in self.inputs])
+        for group in self.groups:
+            self.frus |= set(group.frus)
+        self.missing = set()
+        self.alarms = set()
+        self.no_output = False
+        self.last_inputs = {}
+
+    def add_inputs(self, names):
+        for v in names:
+            board, sname = v.split(":")
+            self.inputs.append((v, board, sname))
+
+    def resolve_groups(self, sensors):
+        for group in self.groups:
+            names = group.resolve(sensors)
+            if names:
+                info("Zone %s: %s matched %s" %
+                     (self.name, group.pattern, ', '.join(names)))
+                self.expr_meta['ext_vars'] |= set(names)
+                self.add_inputs(names)
 
     def run(self, sensors, dt):
+        if self.groups:
+            self.resolve_groups(sensors)
         ctx = {'dt': dt}
         outmin = 0
         missing = set()
-        for v in self.expr_meta['ext_vars']:
-            board, sname = v.split(":")
+        alarms = set()
+        for (v, board, sname) in self.inputs:
             if sname in sensors[board]:
                 sensor = sensors[board][sname]
                 ctx[v] = sensor.value
                 if sensor.status in ['ucr', 'unr', 'lnr', 'lcr']:
-                    warn('Sensor %s reporting status %s' %
-                         (sensor.name, sensor.status))
+                    if (v, sensor.status) not in self.alarms:
+                        warn('Sensor %s reporting status %s' %
+                             (sensor.name, sensor.status))
+                    alarms.add((v, sensor.status))
                     outmin = transitional
             else:
                 missing.add(v)
                 # evaluation tries to ignore the effects of None values
                 # (e.g. acts as 0 in max/+)
                 ctx[v] = None
-        if missing:
+        # Only complain when the set changes, a FRU that is off or backed
+        # off would otherwise log the same warning every tick
+        if missing and missing != self.missing:
             warn('Missing sensors: %s' % (', '.join(missing),))
-        if verbose:
+        elif self.missing and not missing:
+            info('Zone %s has all of its sensors again' % (self.name,))
+        self.missing = missing
+        self.alarms = alarms
+        self.last_inputs = ctx
+        if verbose and not quiet:
             (exprout, dxstr) = self.expr.dbgeval(ctx)
             print(dxstr + " = " + str(exprout))
         else:
             exprout = self.expr.eval(ctx)
-            print(self.expr_str + " = " + str(exprout))
+            if not quiet:
+                print(self.expr_str + " = " + str(exprout))
         # If *all* sensors in the top level max() report None, the
         # expression will report None
         if not exprout:
-            crit('No sane fan speed could be calculated! Using transitional speed.')
+            if not self.no_output:
+                crit('No sane fan speed could be calculated! Using transitional speed.')
+            self.no_output = True
             exprout = transitional
+        elif self.no_output:
+            info('Zone %s is computing fan speeds again' % (self.name,))
+            self.no_output = False
         if exprout < outmin:
             exprout = outmin
         exprout = clamp(exprout, 0, 100)
@@ -213,35 +294,214 @@ class Zone:
 def profile_constructor(data):
     return lambda: make_controller(data)
 
-def main():
+def apply_config(config):
     global transitional
     global boost
     global boost_type
-    global wdfile
     global ramp_rate
+    transitional = config['pwm_transition_value']
+    boost = config['pwm_boost_value']
+    if 'boost' in config and 'progressive' in config['boost']:
+        if config['boost']['progressive']:
+            boost_type = 'progressive'
+    if 'ramp_rate' in config:
+        ramp_rate = config['ramp_rate']
+
+def load_zones(config, config_dir=CONFIG_DIR, frus=None):
+    '''
+    Builds the zones of config. Sensor group patterns are matched against
+    frus, by default the 'frus' config list or else libpal's FRU list.
+    '''
+    if frus is None:
+        frus = config.get('frus') or pal_get_fru_list() or []
+    profile_constructors = {}
+    for name, pdata in config['profiles'].items():
+        profile_constructors[name] = profile_constructor(pdata)
+
+    console("Available profiles: " + ", ".join(profile_constructors.keys()))
+
+    cache = None
+    cache_dir = config.get('expr_cache_dir', EXPR_CACHE_DIR)
+    if cache_dir:
+        cache = fsc_expr.ExprCache(cache_dir,
+                                   json.dumps(config['profiles'],
+                                              sort_keys=True))
+
+    zones = []
+    for zname, data in config['zones'].items():
+        filename = data['expr_file']
+        with open(os.path.join(config_dir, filename), 'r') as exf:
+            source = exf.read()
+            console("Compiling FSC expression for zone:")
+            console(source)
+            (expr, inf) = fsc_expr.make_eval_tree(source,
+                                                  profile_constructors,
+                                                  cache)
+            for group in inf['groups']:
+                group.expand_frus(frus)
+                if not group.frus:
+                    warn("Zone %s: no FRU matches %s" % (zname, group.pattern))
+            expr = fsc_expr.compile_eval_tree(expr)
+            zinterval = data.get('sample_interval_ms',
+                                 config['sample_interval_ms']) / 1000.0
+            zone = Zone(data['pwm_output'], expr, inf, zname, zinterval)
+            zones.append(zone)
+    if cache is not None:
+        cache.prune()
+    return zones
+
+def update_dead_fans(machine, speeds, dead_fans, min_rpm):
+    last_dead_fans = dead_fans.copy()
+    for fan, rpms in speeds.items():
+        console("Fan %d speed: %d RPM" % (fan, rpms))
+        if rpms < min_rpm:
+            dead_fans.add(fan)
+            machine.fan_dead(fan)
+        else:
+            dead_fans.discard(fan)
+    recovered_fans = last_dead_fans - dead_fans
+    newly_dead_fans = dead_fans - last_dead_fans
+    if len(newly_dead_fans) > 0:
+        crit("%d fans failed" % (len(dead_fans),))
+        for dead_fan_num in dead_fans:
+            crit("Fan %d dead, %d RPM" % (dead_fan_num,
+                                          speeds.get(dead_fan_num, 0)))
+    for fan in recovered_fans:
+        crit("Fan %d has recovered" % (fan,))
+        machine.fan_recovered(fan)
+
+def fan_fail_boost(pwmval, dead_fans):
+    if boost_type == 'progressive':
+        dead = len(dead_fans)
+        if dead > 0:
+            console("Failed fans: %s" %
+              (', '.join([str(i) for i in dead_fans],)))
+            if dead < 3:
+              pwmval = clamp(pwmval + (10 * dead), 0, 100)
+              console("Boosted PWM to %d" % pwmval)
+            else:
+              pwmval = boost
+    else:
+        if dead_fans:
+            console("Failed fans: %s" %
+              (', '.join([str(i) for i in dead_fans],)))
+            pwmval = boost
+    return pwmval
+
+def zone_pwm(zone, sensors, dt, dead_fans, intrusion_boost):
+    '''
+    Runs one zone and applies fan failure/intrusion boost and the ramp rate
+    limit to its output. Returns the new PWM and stores it as zone.last_pwm.
+    '''
+    if not intrusion_boost:
+        pwmval = zone.run(sensors, dt)
+    else:
+        pwmval = boost
+
+    pwmval = fan_fail_boost(pwmval, dead_fans)
+
+    if abs(zone.last_pwm - pwmval) > ramp_rate:
+        if pwmval < zone.last_pwm:
+           pwmval = zone.last_pwm - ramp_rate
+        else:
+           pwmval = zone.last_pwm + ramp_rate
+    zone.last_pwm = pwmval
+    return pwmval
+
+def boost_zones(zones, dead_fans, intrusion_boost):
+    '''
+    Raises every zone to its fan failure/intrusion boost between ticks,
+    without running the zones or waiting for the ramp rate. Outputs are
+    never lowered here; the next regular run of each zone takes over again.
+    '''
+    for zone in zones:
+        if intrusion_boost:
+            pwmval = boost
+        else:
+            pwmval = fan_fail_boost(zone.last_pwm, dead_fans)
+        zone.last_pwm = max(zone.last_pwm, pwmval)
+
+def zone_state(zone):
+    return {'last_pwm': zone.last_pwm,
+            'ops': [op.get_state()
+                    for op in fsc_expr.stateful_ops(zone.expr.root)]}
+
+def restore_zone_state(zone, state):
+    ops = fsc_expr.stateful_ops(zone.expr.root)
+    if len(ops) != len(state['ops']):
+        return False
+    for (op, op_state) in zip(ops, state['ops']):
+        op.set_state(op_state)
+    zone.last_pwm = state['last_pwm']
+    return True
+
+def boost_reason(dead_fans, intrusion_boost):
+    reasons = []
+    if intrusion_boost:
+        reasons.append('chassis intrusion')
+    if dead_fans:
+        reasons.append('failed fans ' +
+                       ', '.join([str(fan) for fan in sorted(dead_fans)]))
+    return ', '.join(reasons)
+
+def log_boost(reason, last_reason):
+    if reason and reason != last_reason:
+        warn("Boosting fans: %s" % (reason,))
+    elif last_reason and not reason:
+        info("Fan boost cleared")
+    return reason
+
+def request_zone_outputs(zones, stage):
+    # Zones that were not due keep asking for their last value, so a
+    # shared output isn't lowered by a faster zone in between their runs
+    for zone in zones:
+        if hasattr(zone.pwm_output, '__iter__'):
+            for output in zone.pwm_output:
+                stage.request(output, zone.last_pwm)
+        else:
+            stage.request(zone.pwm_output, zone.last_pwm)
+
+def main():
+    global wdfile
+    global quiet
+    global tick_log
     syslog.openlog("fscd")
     info("starting")
     machine.set_all_pwm(transitional)
     configfile = "config.json"
     config = None
-    zones = []
     if os.path.isfile(RAMFS_CONFIG):
         configfile = RAMFS_CONFIG
     info("Started, reading configuration from %s" % (configfile,))
     with open(configfile, 'r') as f:
         config = json.load(f)
-    transitional = config['pwm_transition_value']
-    boost = config['pwm_boost_value']
-    if 'boost' in config and 'progressive' in config['boost']:
-        if config['boost']['progressive']:
-            boost_type = 'progressive'
+    apply_config(config)
+    if config.get('quiet', False):
+        quiet = True
     watchdog = config['watchdog']
     if 'chassis_intrusion' in config:
         chassis_intrusion = config['chassis_intrusion']
     else:
         chassis_intrusion = False
-    if 'ramp_rate' in config:
-        ramp_rate = config['ramp_rate']
+    if 'pwm_refresh_ticks' in config:
+        pwm_stage.refresh = config['pwm_refresh_ticks']
+    tach_inputs = {}
+    if 'tach_inputs' in config:
+        for fan, path in config['tach_inputs'].items():
+            tach_inputs[int(fan)] = path
+    elif 'tach_dir' in config:
+        tach_inputs = discover_tach_inputs(config['tach_dir'],
+                                           pal_get_tach_cnt())
+    if tach_inputs:
+        machine.tach_reader = TachReader(tach_inputs)
+        info("Reading fan speed from: " +
+             ", ".join([tach_inputs[f] for f in sorted(tach_inputs.keys())]))
+    if 'sensor_backend' in config:
+        machine.sensor_backend = make_sensor_backend(config['sensor_backend'])
+        if machine.sensor_backend.name != config['sensor_backend']:
+            warn("sensor backend '%s' not available, using '%s'" %
+                 (config['sensor_backend'], machine.sensor_backend.name))
+    info("Reading sensors through %s" % (machine.sensor_backend.name,))
     wdfile = None
     if watchdog:
         info("watchdog pinging enabled")
@@ -252,102 +512,164 @@ def main():
             wdfile.write('V')
             wdfile.flush()
     machine.set_all_pwm(transitional)
-    profile_constructors = {}
-    for name, pdata in config['profiles'].items():
-        profile_constructors[name] = profile_constructor(pdata)
-
-    print("Available profiles: " + ", ".join(profile_constructors.keys()))
-
-    for name, data in config['zones'].items():
-        filename = data['expr_file']
-        with open(os.path.join(CONFIG_DIR, filename), 'r') as exf:
-            source = exf.read()
-            print("Compiling FSC expression for zone:")
-            print(source)
-            (expr, inf) = fsc_expr.make_eval_tree(source, profile_constructors)
-            for name in inf['ext_vars']:
-                board, sname = name.split(':')
-                machine.frus.add(board)
-            zone = Zone(data['pwm_output'], expr, inf)
-            zones.append(zone)
+    interval = config['sample_interval_ms'] / 1000.0
+    zones = load_zones(config)
+    for zone in zones:
+        machine.frus |= zone.frus
     info("Read %d zones" % (len(zones),))
     info("Including sensors from: " + ", ".join(machine.frus))
-    interval = config['sample_interval_ms'] / 1000.0
+    if 'concurrent_sensor_read' in config:
+        cread = config['concurrent_sensor_read']
+        workers = max(1, min(cread.get('workers', 4), len(machine.frus)))
+        deadline = cread.get('deadline_ms', config['sample_interval_ms'])
+        fru_deadlines = {}
+        for fru, ms in cread.get('fru_deadline_ms', {}).items():
+            fru_deadlines[fru] = ms / 1000.0
+        machine.sensor_reader = ConcurrentSensorReader(
+                machine.sensor_backend, workers, deadline / 1000.0,
+                fru_deadlines)
+        info("Reading sensors concurrently with %d workers" % (workers,))
+    if 'fru_breaker' in config:
+        bconf = config['fru_breaker']
+        machine.breaker = FruBreaker(
+                bconf.get('failures', 3),
+                bconf.get('backoff_ms', 10000) / 1000.0,
+                bconf.get('max_backoff_ms', 60000) / 1000.0,
+                bconf.get('stale_ms', 0) / 1000.0)
+
+    stats = LoopStats(config.get('stats_file', STATS_FILE))
+    snapshot = SensorSnapshot(config.get('sensor_snapshot_file',
+                                         SNAPSHOT_FILE))
+    checkpoint = Checkpoint(
+            config.get('checkpoint_file', CHECKPOINT_FILE),
+            config_hash(config, [str(zone.expr) for zone in zones]),
+            config.get('checkpoint_max_age_ms', 60000) / 1000.0)
+    saved = checkpoint.load()
+    if saved:
+        restored = [zone.name for zone in zones
+                    if zone.name in saved and
+                    restore_zone_state(zone, saved[zone.name])]
+        if restored:
+            info("Resuming zones %s from %s" %
+                 (', '.join(restored), checkpoint.path))
+            request_zone_outputs(zones, pwm_stage)
+            pwm_stage.flush(machine.set_pwm)
+    tick_log = TickLog(config.get('tick_log_file', TICK_LOG_FILE),
+                       config.get('tick_log_size', 200))
+    trace = None
+    if 'trace_file' in config:
+        trace = TraceRecorder(config['trace_file'])
+        info("Recording sensor trace to %s" % (config['trace_file'],))
 
-    last = time.time()
+    events = None
+    if 'events' in config:
+        econf = config['events']
+        gpios = []
+        if 'intrusion_gpio' in econf:
+            gpios.append(econf['intrusion_gpio'])
+        events = EventSource(gpios, machine.tach_reader, config['min_rpm'],
+                             econf.get('sample_interval_ms', 500) / 1000.0)
+        info("Watching for fan failure and intrusion between ticks")
+
+    # Every zone first runs after the global interval, then at its own rate.
+    # Sensors of a FRU are only read on ticks where a zone using them is due.
+    if events:
+        sched = Scheduler(sleep=events.sleep)
+    else:
+        sched = Scheduler()
+    for zone in zones:
+        sched.add(zone, zone.interval, interval)
     dead_fans = set()
+    boosting = ''
     while True:
-        last_dead_fans = dead_fans.copy()
         if wdfile:
             wdfile.write('V')
             wdfile.flush()
-        time.sleep(interval)
-        sensors = machine.read_sensors()
+        due = sched.wait()
+        if not due:
+            # Woken up between ticks: boost right away if needed
+            stats.count('events', len(events.take()))
+            intrusion_boost = 0
+            if chassis_intrusion and machine.chassis_intrusion() == 1:
+                intrusion_boost = 1
+            if events.speeds is not None:
+                update_dead_fans(machine, events.speeds, dead_fans,
+                                 config['min_rpm'])
+            boosting = log_boost(boost_reason(dead_fans, intrusion_boost),
+                                 boosting)
+            if intrusion_boost or dead_fans:
+                boost_zones(zones, dead_fans, intrusion_boost)
+                request_zone_outputs(zones, pwm_stage)
+                pwm_stage.flush(machine.set_pwm)
+            continue
+        tick_start = monotonic()
+        stats.count('ticks')
+        for (zone, missed) in sched.overruns:
+            warn("Zone %s overran, skipped %d periods" % (zone.name, missed))
+            stats.count('skipped_periods', missed)
+        frus = set()
+        for (zone, dt) in due:
+            frus |= zone.frus
+        sensors = machine.read_sensors(frus)
+        stats.record('phase', 'sensor_read', monotonic() - tick_start)
+        for fru, elapsed in machine.fru_read_times.items():
+            stats.record('fru_read', fru, elapsed)
+        snapshot.update(dict((fru, sensors[fru]) for fru in machine.fresh))
+        start = monotonic()
         speeds = machine.read_speed()
-        fan_fail = False
-        now = time.time()
-        dt = now - last
-        last = now
-        print("\x1b[2J\x1b[H")
-        sys.stdout.flush()
-        for fan, rpms in speeds.items():
-            print("Fan %d speed: %d RPM" % (fan, rpms))
-            if rpms < config['min_rpm']:
-                dead_fans.add(fan)
-                pal_fan_dead_handle(fan)
-            else:
-                dead_fans.discard(fan)
-        recovered_fans = last_dead_fans - dead_fans
-        newly_dead_fans = dead_fans - last_dead_fans
-        if len(newly_dead_fans) > 0:
-            crit("%d fans failed" % (len(dead_fans),))
-            for dead_fan_num in dead_fans:
-                crit("Fan %d dead, %d RPM" % (dead_fan_num, speeds[dead_fan_num]))
-        for fan in recovered_fans:
-            crit("Fan %d has recovered" % (fan,))
-            pal_fan_recovered_handle(fan)
-        for zone in zones:
-            print("PWM: %s" % (json.dumps(zone.pwm_output)))
-
-            chassis_intrusion_boost_flag=0
-            if chassis_intrusion:
-               self_tray_pull_out = pal_fan_chassis_intrusion_handle()
-               if self_tray_pull_out == 1:
-                  chassis_intrusion_boost_flag = 1 
+        stats.record('phase', 'tach_read', monotonic() - start)
+        if trace:
+            trace.record(tick_start, sensors, speeds)
+        eval_start = monotonic()
+        if not quiet:
+            print("\x1b[2J\x1b[H")
+            sys.stdout.flush()
+        update_dead_fans(machine, speeds, dead_fans, config['min_rpm'])
+        chassis_intrusion_boost_flag=0
+        if chassis_intrusion:
+           self_tray_pull_out = machine.chassis_intrusion()
+           if self_tray_pull_out == 1:
+              chassis_intrusion_boost_flag = 1
+        boosting = log_boost(boost_reason(dead_fans,
+                                          chassis_intrusion_boost_flag),
+                             boosting)
+        for (zone, dt) in due:
+            console("PWM: %s" % (json.dumps(zone.pwm_output)))
+            start = monotonic()
+            zone_pwm(zone, sensors, dt, dead_fans, chassis_intrusion_boost_flag)
+            stats.record('zone_eval', zone.name, monotonic() - start)
+        stats.record('phase', 'eval', monotonic() - eval_start)
 
-            if  chassis_intrusion_boost_flag == 0:     
-                pwmval = zone.run(sensors, dt)
-            else:
-                pwmval = boost
-                       
-            if boost_type == 'progressive':
-                dead = len(dead_fans)
-                if dead > 0:
-                    print("Failed fans: %s" %
-                      (', '.join([str(i) for i in dead_fans],)))
-                    if dead < 3:
-                      pwmval = clamp(pwmval + (10 * dead), 0, 100)
-                      print("Boosted PWM to %d" % pwmval)
-                    else:
-                      pwmval = boost
-            else:
-                if dead_fans:
-                    print("Failed fans: %s" %
-                      (', '.join([str(i) for i in dead_fans],)))
-                    pwmval = boost
-
-            if abs(zone.last_pwm - pwmval) > ramp_rate:
-                if pwmval < zone.last_pwm:
-                   pwmval = zone.last_pwm - ramp_rate
-                else:
-                   pwmval = zone.last_pwm + ramp_rate
-            zone.last_pwm = pwmval
-                
-            if hasattr(zone.pwm_output, '__iter__'):
-                for output in zone.pwm_output:
-                    machine.set_pwm(output, pwmval)
-            else:
-                machine.set_pwm(zone.pwm_output, pwmval)
+        request_zone_outputs(zones, pwm_stage)
+        start = monotonic()
+        pwm_stage.flush(machine.set_pwm)
+        stats.record('phase', 'pwm_write', monotonic() - start)
+        stats.record('phase', 'tick', monotonic() - tick_start)
+        zone_ticks = {}
+        for (zone, dt) in due:
+            zone_ticks[zone.name] = {'pwm': zone.last_pwm,
+                                     'inputs': zone.last_inputs}
+        tick_log.record({'t': time.time(),
+                         'zones': zone_ticks,
+                         'speeds': speeds,
+                         'dead_fans': sorted(dead_fans),
+                         'boost': boosting,
+                         'outputs': dict(pwm_stage.written)})
+        try:
+            stats.dump()
+        except (IOError, OSError) as e:
+            warn("Failed to write %s: %s" % (stats.path, str(e)))
+        try:
+            snapshot.publish()
+        except (IOError, OSError) as e:
+            warn("Failed to write %s: %s" % (snapshot.path, str(e)))
+        zone_states = {}
+        for zone in zones:
+            zone_states[zone.name] = zone_state(zone)
+        try:
+            checkpoint.save(zone_states)
+        except (IOError, OSError) as e:
+            warn("Failed to write %s: %s" % (checkpoint.path, str(e)))
 
 def handle_term(signum, frame):
     global wdfile
@@ -361,8 +683,21 @@ def handle_term(signum, frame):
         wdfile = None
     sys.exit('killed')
 
+def handle_dump(signum, frame):
+    if tick_log is None:
+        return
+    try:
+        tick_log.dump()
+        info("Wrote the last %d ticks to %s" %
+             (len(tick_log.ticks), tick_log.path))
+    except (IOError, OSError) as e:
+        warn("Failed to write %s: %s" % (tick_log.path, str(e)))
+
 if __name__ == "__main__":
     try:
+        signal.signal(signal.SIGUSR1, handle_dump)
+        # Don't let a dump request fail the reads in progress with EINTR
+        signal.siginterrupt(signal.SIGUSR1, False)
         signal.signal(signal.SIGTERM, handle_term)
         signal.signal(signal.SIGINT, handle_term)
         signal.signal(signal.SIGQUIT, handle_term)
@@ -1,7 +1,12 @@
 from ctypes import *
 import subprocess
 
-lpal_hndl = CDLL("libpal.so")
+try:
+    lpal_hndl = CDLL("libpal.so")
+except OSError:
+    # Lets the fscd modules be imported off the BMC (e.g. by fsc_replay.py);
+    # the pal_* calls themselves are unusable there.
+    lpal_hndl = None
 
 
 def pal_fan_dead_handle(fan):
@@ -26,3 +31,56 @@ def pal_fan_chassis_intrusion_handle():
         return None
     else:
         return self_tray_pull_out.value
+
+def pal_sensor_read_supported():
+    for sym in ['pal_get_fru_id', 'pal_sensor_read']:
+        if not hasattr(lpal_hndl, sym):
+            return False
+    return True
+
+def pal_get_fru_id(fru_name):
+    fru = c_uint8()
+    fru_point = pointer(fru)
+    ret = lpal_hndl.pal_get_fru_id(c_char_p(fru_name), fru_point)
+    if ret:
+        return None
+    else:
+        return fru.value
+
+def pal_sensor_read(fru, sensor_num):
+    value = c_float()
+    value_point = pointer(value)
+    ret = lpal_hndl.pal_sensor_read(fru, sensor_num, value_point)
+    if ret:
+        return None
+    else:
+        return value.value
+
+def pal_set_fan_speed_supported():
+    return hasattr(lpal_hndl, 'pal_set_fan_speed')
+
+def pal_set_fan_speed(fan, pwm):
+    ret = lpal_hndl.pal_set_fan_speed(fan, pwm)
+    if ret:
+        return None
+    else:
+        return ret
+
+def pal_get_tach_cnt():
+    if lpal_hndl is None:
+        return None
+    try:
+        return c_size_t.in_dll(lpal_hndl, 'pal_tach_cnt').value
+    except (ValueError, TypeError):
+        return None
+
+def pal_get_fru_list():
+    if not hasattr(lpal_hndl, 'pal_get_fru_list'):
+        return None
+    frus = create_string_buffer(256)
+    ret = lpal_hndl.pal_get_fru_list(frus)
+    if ret:
+        return None
+    else:
+        return [fru.strip() for fru in frus.value.split(',')
+                if fru.strip() and fru.strip() != 'all']
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Cache for the information of resource nodes
+
+import threading
+import time
+
+
+class Flight:
+    '''A computation in progress that other requests can wait for'''
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    '''
+    Caches values by key for a given time to live. Requests for a key that
+    is already being computed wait for that computation and share its
+    result instead of starting their own, even when ttl is 0. invalidate()
+    drops entries under a path, and keeps computations that were already
+    running at the time from filling the cache with what may be old data.
+    '''
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.flights = {}
+        self.generation = 0
+
+    def get(self, key, ttl, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                return entry[1]
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight(self.generation)
+                self.flights[key] = flight
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                if (flight.error is None and ttl > 0 and
+                        flight.generation == self.generation):
+                    self.entries[key] = (self.clock() + ttl, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, path):
+        '''Drops the entries for path and everything below it'''
+        with self.lock:
+            self.generation += 1
+            for key in self.entries.keys():
+                if key == path or key.startswith(path + '/'):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries = {}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Cache of parsed FRU information (weutil, fruid-util), keyed on the
+# contents of the FRU's EEPROM. FRU data practically never changes while
+# the BMC is up, so forking the parser on every request is wasted work.
+# A lookup only stats the EEPROM sysfs file and reads the generation file;
+# the EEPROM is read and hashed again when either has changed, or every
+# RECHECK seconds. Tools that write a FRU EEPROM bump the generation with
+#
+#   fruid_cache.py --invalidate
+#
+# since writes through i2cset don't touch the sysfs file's mtime. A new
+# generation also drops all parsed information, so every FRU is parsed
+# again even if the part of its EEPROM that is hashed didn't change.
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+
+GENERATION_FILE = '/tmp/fruid_cache.gen'
+# Enough for the FRU info formats in use (the Facebook EEPROM v2 is 176
+# bytes); reading the whole 8K part over I2C would cost more than weutil.
+READ_SIZE = 512
+RECHECK = 600
+MAX_ENTRIES = 32
+
+
+def file_stamp(path):
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+
+def read_generation(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def content_digest(path, size):
+    '''sha1 of the first size bytes of path, None if it can't be read'''
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read(size)).hexdigest()
+    except IOError:
+        return None
+
+
+def invalidate(generation_file=GENERATION_FILE):
+    '''Makes every FruidCache recheck its EEPROMs, in any process'''
+    tmp = generation_file + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('%.6f %d\n' % (time.time(), os.getpid()))
+    os.rename(tmp, generation_file)
+
+
+class FruidCache:
+    '''
+    Parsed FRU information by FRU name and EEPROM contents. Information
+    that came out empty (the parser failed) is not kept. Only one parser
+    runs per FRU at a time, concurrent lookups wait for it.
+    '''
+    def __init__(self, clock=time.time, generation_file=GENERATION_FILE,
+                 read_size=READ_SIZE, recheck=RECHECK):
+        self.clock = clock
+        self.generation_file = generation_file
+        self.read_size = read_size
+        self.recheck = recheck
+        self.lock = threading.Lock()
+        self.generation = None
+        # name -> (stamp, digest, time checked, info)
+        self.frus = {}
+        # (name, digest) -> info, for every EEPROM content seen
+        self.infos = {}
+        self.fill_locks = {}
+
+    def lookup(self, name, stamp, now):
+        with self.lock:
+            entry = self.frus.get(name)
+            if (entry is not None and entry[0] == stamp and
+                    now - entry[2] < self.recheck):
+                return entry[3]
+        return None
+
+    def get(self, name, eeprom, read):
+        '''
+        Returns the information of FRU name, whose EEPROM sysfs file is
+        eeprom (None if it has none). read() parses the FRU and is only
+        called when the EEPROM contents haven't been seen since the last
+        generation bump; FRUs without an EEPROM file are read again
+        whenever they are rechecked.
+        '''
+        now = self.clock()
+        stamp = (file_stamp(eeprom), read_generation(self.generation_file))
+        info = self.lookup(name, stamp, now)
+        if info is not None:
+            return info
+        with self.lock:
+            fill_lock = self.fill_locks.setdefault(name, threading.Lock())
+        with fill_lock:
+            # Someone else may have refreshed the FRU while we waited
+            info = self.lookup(name, stamp, now)
+            if info is not None:
+                return info
+            digest = content_digest(eeprom, self.read_size)
+            with self.lock:
+                if stamp[1] != self.generation:
+                    self.generation = stamp[1]
+                    self.infos = {}
+                if digest is not None:
+                    info = self.infos.get((name, digest))
+            if info is None:
+                info = read()
+            if not info:
+                return info
+            with self.lock:
+                if digest is not None:
+                    if len(self.infos) >= MAX_ENTRIES:
+                        self.infos = {}
+                    self.infos[(name, digest)] = info
+                self.frus[name] = (stamp, digest, now, info)
+        return info
+
+    def clear(self):
+        with self.lock:
+            self.frus = {}
+            self.infos = {}
+
+
+cache = FruidCache()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Manage the cache of parsed FRU information')
+    parser.add_argument('--invalidate', action='store_true',
+                        help='make readers check the FRU EEPROMs again, '
+                             'run after writing one')
+    args = parser.parse_args()
+    if args.invalidate:
+        invalidate()
+    else:
+        parser.print_usage()
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,9 @@
 # Class Definition for Resource
 
 class node:
+    # Seconds rest.py may serve getInformation() from its cache
+    cache_ttl = 0
+
     def __init__(self, info = None, actions = None):
         if info == None:
             self.info = {}
@@ -25,6 +25,8 @@ from pal import *
 from uuid import getnode as get_mac
 
 class bmcNode(node):
+    cache_ttl = 10
+
     def __init__(self, info = None, actions = None):
         if info == None:
             self.info = {}
@@ -20,10 +20,19 @@
 
 from subprocess import *
 from node import node
+import fruid_cache
+
+# Where fruid-util reads a FRU from: the copy of its EEPROM that ipmid or
+# bic-util dump at boot
+FRU_BIN = '/tmp/fruid_%s.bin'
 
 class fruidNode(node):
-    def __init__(self, name, info = None, actions = None):
+    # Left out of the response cache: fruid_cache already skips re-reading
+    # an unchanged FRU, and notices when its EEPROM is rewritten
+
+    def __init__(self, name, info = None, actions = None, eeprom = None):
         self.name = name
+        self.eeprom = eeprom
 
         if info == None:
             self.info = {}
@@ -35,6 +44,11 @@ class fruidNode(node):
             self.actions = actions
 
     def getInformation(self):
+        result = fruid_cache.cache.get(self.name, self.eeprom,
+                                       self.readInformation)
+        return dict(result)
+
+    def readInformation(self):
         result = {}
         cmd = '/usr/local/bin/fruid-util ' + self.name
         data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
@@ -54,5 +68,7 @@ class fruidNode(node):
 
         return result
 
-def get_node_fruid(name):
-    return fruidNode(name)
+def get_node_fruid(name, eeprom = None):
+    if eeprom == None:
+        eeprom = FRU_BIN % name
+    return fruidNode(name, eeprom = eeprom)
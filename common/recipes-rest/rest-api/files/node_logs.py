@@ -23,6 +23,8 @@ from subprocess import *
 from node import node
 
 class logsNode(node):
+    cache_ttl = 5
+
     def __init__(self, name, info = None, actions = None):
         self.name = name
 
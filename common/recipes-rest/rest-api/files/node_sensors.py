@@ -23,8 +23,11 @@ import json
 import os
 import re
 from node import node
+from sensor_snapshot import read_fru_sensors
 
 class sensorsNode(node):
+    cache_ttl = 5
+
     def __init__(self, name, info = None, actions = None):
         self.name = name
         if info == None:
@@ -37,6 +40,9 @@ class sensorsNode(node):
             self.actions = actions
 
     def getInformation(self):
+        result = read_fru_sensors(self.name)
+        if result is not None:
+            return result
         result = {}
         cmd = '/usr/local/bin/sensor-util ' + self.name
         data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
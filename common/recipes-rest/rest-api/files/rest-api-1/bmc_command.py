@@ -23,13 +23,24 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import ctypes
+import errno
+import fcntl
 import os
 import subprocess
 import select
+import signal
 import sys
+import threading
 import time
 
 DEFAULT_TIMEOUT = 10 #sec
+DEFAULT_MAX_OUTPUT = 4 * 1024 * 1024 #bytes
+DEFAULT_CONCURRENCY = 8
+KILL_GRACE = 0.1 #sec between SIGTERM and SIGKILL
+REAP_TIMEOUT = 1.0 #sec to wait for a killed process before giving up
+BUFSIZE = 4096
+CLOCK_MONOTONIC = 1
 
 # Note: Python 3.0 supports communicate() with a timeout option.
 # If we upgrade to this version we will no longer need timed_communicate
@@ -40,9 +51,38 @@ class TimeoutError(Exception):
         self.output = output
         self.error = error
 
+class OutputLimitError(Exception):
+    def __init__(self, output, error):
+        super(OutputLimitError, self).__init__('process output too large')
+        self.output = output
+        self.error = error
+
 class WaitTimeoutError(Exception):
     pass
 
+class timespec(ctypes.Structure):
+    _fields_ = [(str('tv_sec'), ctypes.c_long),
+                (str('tv_nsec'), ctypes.c_long)]
+
+def find_clock_gettime():
+    for lib in [None, 'librt.so.1']:
+        try:
+            return ctypes.CDLL(lib).clock_gettime
+        except (OSError, AttributeError):
+            continue
+    return None
+
+_clock_gettime = find_clock_gettime()
+
+def monotonic():
+    '''Seconds from CLOCK_MONOTONIC, or wall time if it isn't available'''
+    if _clock_gettime is None:
+        return time.time()
+    ts = timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(ts)):
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
 def kill_process(proc):
     proc.terminate()
     try:
@@ -60,53 +100,338 @@ def kill_process(proc):
 
 def timed_wait(proc, timeout):
     # There unfortunately isn't a great way to wait for a process with a
-    # timeout, other than polling.  (Registering for SIGCHLD and sleeping might
-    # be one option, but that's fragile and not thread-safe.)
+    # timeout, other than polling.  CommandExecutor avoids this by waiting
+    # for its processes to close their output first.
     poll_interval = 0.1
-    end_time = time.time() + timeout
+    end_time = monotonic() + timeout
     while True:
         if proc.poll() is not None:
             return
-        time_left = max(end_time - time.time(), 0)
+        time_left = max(end_time - monotonic(), 0)
         if time_left <= 0:
             raise WaitTimeoutError()
         time.sleep(min(time_left, poll_interval))
 
-def timed_communicate(proc, timeout=DEFAULT_TIMEOUT):
-    end_time = time.time() + timeout
-
-    p = select.poll()
-    outfd = proc.stdout.fileno()
-    errfd = proc.stderr.fileno()
-    p.register(outfd, select.POLLIN)
-    p.register(errfd, select.POLLIN)
-    results = {outfd: [], errfd: []}
-    remaining_fds = set([outfd, errfd])
-
-    bufsize = 4096
-    while remaining_fds:
-        time_left = max(end_time - time.time(), 0)
-        r = p.poll(time_left * 1000)  # poll() takes timeout in milliseconds
-        if not r:
-            kill_process(proc)
-            raise TimeoutError(b''.join(results[outfd]),
-                               b''.join(results[errfd]))
-        for fd, flags in r:
-            # We didn't put the fds in non-blocking mode, but we know the fd
-            # has data to read, so os.read() will return immediately.
-            d = os.read(fd, bufsize)
-            if d:
-                results[fd].append(d)
+def set_flags(fd, flags):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | flags)
+    fcntl.fcntl(fd, fcntl.F_SETFD,
+                fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+
+class Command(object):
+    def __init__(self, start, timeout, max_output, group=False):
+        self.start = start
+        self.group = group
+        self.proc = None
+        self.timeout = timeout
+        self.deadline = None
+        self.max_output = max_output
+        self.streams = []
+        self.open_fds = set()
+        self.chunks = {}
+        self.size = 0
+        self.killed_at = None
+        self.sigkilled = False
+        self.reap_delay = None
+        self.counted = False
+        self.failure = None
+        self.exception = None
+        self.done = threading.Event()
+
+    def output(self, fd):
+        if fd is None:
+            return None
+        return b''.join(self.chunks.get(fd, []))
+
+    def result(self):
+        '''
+        Waits for the command, returns (output, error) or raises. Once the
+        command has started, the wait ends when the executor would have
+        given up on it anyway, even if the executor itself is stuck.
+        '''
+        while not self.done.is_set():
+            if self.deadline is None:
+                # Queued, or running without a timeout
+                self.done.wait(self.timeout)
+                continue
+            give_up = self.deadline + KILL_GRACE + REAP_TIMEOUT
+            if not self.done.wait(max(give_up - monotonic(), 0)):
+                # Whatever it has written so far
+                (out_fd, err_fd) = (self.streams + [None, None])[:2]
+                raise TimeoutError(self.output(out_fd), self.output(err_fd))
+        if self.exception is not None:
+            raise self.exception
+        (output, error) = [self.output(fd) for fd in self.streams]
+        if self.failure is not None:
+            raise self.failure(output, error)
+        return (output, error)
+
+
+class CommandExecutor(object):
+    '''
+    Runs the child processes of all REST handlers from one thread. Their
+    output is read through a single poll() set, timeouts are enforced there
+    (SIGTERM, then SIGKILL), and output beyond max_output gets the process
+    killed. A handler thread just blocks until its command is done, without
+    polling. At most 'concurrency' commands run at once, others are queued.
+
+    A process is reaped once it has closed its output. With
+    install_sigchld() SIGCHLD then wakes the executor; otherwise it checks
+    back with a short backoff.
+    '''
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.queue = []
+        self.adopted = []
+        self.running = set()
+        self.started = 0
+        self.fds = {}
+        self.thread = None
+        self.sigchld = False
+        (self.wake_r, self.wake_w) = os.pipe()
+        set_flags(self.wake_r, os.O_NONBLOCK)
+        set_flags(self.wake_w, os.O_NONBLOCK)
+        self.poller = select.poll()
+        self.poller.register(self.wake_r, select.POLLIN)
+
+    def install_sigchld(self):
+        '''Wakes the executor on SIGCHLD. Must be called from main thread'''
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.siginterrupt(signal.SIGCHLD, False)
+        signal.set_wakeup_fd(self.wake_w)
+        self.sigchld = True
+
+    def wake(self):
+        try:
+            os.write(self.wake_w, b'x')
+        except OSError as e:
+            # Pipe full, the executor has a wakeup pending anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def submit(self, cmd, adopted=False):
+        with self.lock:
+            if adopted:
+                self.adopted.append(cmd)
             else:
-                # EOF on this fd, stop listening on it
-                p.unregister(fd)
-                remaining_fds.remove(fd)
+                self.queue.append(cmd)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop)
+                self.thread.daemon = True
+                self.thread.start()
+        self.wake()
+        return cmd
 
-    try:
-        timed_wait(proc, max(end_time - time.time(), 0))
-    except WaitTimeoutError:
-        kill_process(proc)
-        raise TimeoutError(b''.join(results[outfd]),
-                           b''.join(results[errfd]))
+    def run(self, args, timeout=DEFAULT_TIMEOUT,
+            max_output=DEFAULT_MAX_OUTPUT, shell=False):
+        def start():
+            # Own process group, so a timeout also kills what a shell started
+            return subprocess.Popen(args, shell=shell, close_fds=True,
+                                    preexec_fn=os.setsid,
+                                    stdin=open(os.devnull, 'r'),
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        return self.submit(Command(start, timeout, max_output, True))
+
+    def adopt(self, proc, timeout=DEFAULT_TIMEOUT, max_output=None):
+        '''Takes over the output and timeout of an already started process'''
+        return self.submit(Command(lambda: proc, timeout, max_output), True)
 
-    return b''.join(results[outfd]), b''.join(results[errfd])
+    def launch(self, cmd, now):
+        try:
+            cmd.proc = cmd.start()
+        except Exception as e:
+            cmd.exception = e
+            cmd.done.set()
+            return False
+        if cmd.timeout is not None:
+            cmd.deadline = now + cmd.timeout
+        for f in [cmd.proc.stdout, cmd.proc.stderr]:
+            if f is None:
+                cmd.streams.append(None)
+                continue
+            fd = f.fileno()
+            cmd.streams.append(fd)
+            cmd.open_fds.add(fd)
+            cmd.chunks[fd] = []
+            self.fds[fd] = cmd
+            self.poller.register(fd, select.POLLIN)
+        self.running.add(cmd)
+        if not cmd.open_fds:
+            cmd.reap_delay = 0
+        return True
+
+    def launch_pending(self, now):
+        with self.lock:
+            adopted = self.adopted
+            self.adopted = []
+            queued = []
+            while self.queue and self.started < self.concurrency:
+                queued.append(self.queue.pop(0))
+                self.started += 1
+        for cmd in adopted:
+            self.launch(cmd, now)
+        for cmd in queued:
+            if not self.launch(cmd, now):
+                with self.lock:
+                    self.started -= 1
+            else:
+                cmd.counted = True
+
+    def close_fd(self, cmd, fd):
+        self.poller.unregister(fd)
+        del self.fds[fd]
+        cmd.open_fds.discard(fd)
+        if not cmd.open_fds:
+            # Done writing, most likely exiting: reap it now
+            cmd.reap_delay = 0
+
+    def read(self, cmd, fd):
+        try:
+            data = os.read(fd, BUFSIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            data = b''
+        if not data:
+            self.close_fd(cmd, fd)
+            return
+        cmd.chunks[fd].append(data)
+        cmd.size += len(data)
+        if cmd.max_output is not None and cmd.size > cmd.max_output:
+            self.close_fd(cmd, fd)
+            self.kill(cmd, OutputLimitError)
+
+    def send_signal(self, cmd, signum):
+        try:
+            if cmd.group:
+                os.killpg(cmd.proc.pid, signum)
+            else:
+                cmd.proc.send_signal(signum)
+        except OSError:
+            pass
+
+    def kill(self, cmd, failure):
+        if cmd.killed_at is not None:
+            return
+        cmd.failure = failure
+        cmd.killed_at = monotonic()
+        cmd.reap_delay = 0
+        self.send_signal(cmd, signal.SIGTERM)
+
+    def finish(self, cmd):
+        for fd in list(cmd.open_fds):
+            self.close_fd(cmd, fd)
+        for f in [cmd.proc.stdout, cmd.proc.stderr]:
+            if f is not None:
+                f.close()
+        self.running.discard(cmd)
+        if cmd.counted:
+            with self.lock:
+                self.started -= 1
+        cmd.done.set()
+
+    def check(self, now):
+        '''Reaps exited processes, kills the ones out of time'''
+        for cmd in list(self.running):
+            if cmd.reap_delay is not None and cmd.proc.poll() is not None:
+                self.finish(cmd)
+            elif cmd.killed_at is None:
+                if cmd.deadline is not None and now >= cmd.deadline:
+                    self.kill(cmd, TimeoutError)
+            elif now >= cmd.killed_at + KILL_GRACE + REAP_TIMEOUT:
+                # Stuck in the kernel, or children still hold its output
+                # open. Give up, it stays a zombie until it exits.
+                self.finish(cmd)
+            elif now >= cmd.killed_at + KILL_GRACE and not cmd.sigkilled:
+                cmd.sigkilled = True
+                self.send_signal(cmd, signal.SIGKILL)
+
+    def poll_timeout(self, now):
+        times = []
+        for cmd in self.running:
+            if cmd.killed_at is None:
+                if cmd.deadline is not None:
+                    times.append(cmd.deadline)
+            elif cmd.sigkilled:
+                times.append(cmd.killed_at + KILL_GRACE + REAP_TIMEOUT)
+            else:
+                times.append(cmd.killed_at + KILL_GRACE)
+            if cmd.reap_delay is not None and not self.sigchld:
+                # Closed its output but hasn't exited yet: check back soon
+                times.append(now + cmd.reap_delay)
+                cmd.reap_delay = min(max(cmd.reap_delay * 2, 0.005), 0.1)
+        if not times:
+            return -1
+        return max(int((min(times) - now) * 1000) + 1, 0)
+
+    def fail_all(self, e):
+        '''Fails every command the executor has taken on'''
+        with self.lock:
+            adopted = self.adopted
+            self.adopted = []
+        for cmd in list(self.running) + adopted:
+            if cmd.proc is not None and cmd.proc.poll() is None:
+                self.send_signal(cmd, signal.SIGKILL)
+            for fd in list(cmd.open_fds):
+                try:
+                    self.poller.unregister(fd)
+                except KeyError:
+                    pass
+                self.fds.pop(fd, None)
+            cmd.open_fds.clear()
+            if cmd.proc is not None:
+                for f in [cmd.proc.stdout, cmd.proc.stderr]:
+                    if f is not None:
+                        f.close()
+            self.running.discard(cmd)
+            if cmd.counted:
+                with self.lock:
+                    self.started -= 1
+            cmd.exception = e
+            cmd.done.set()
+
+    def step(self):
+        # Reap first, so finished commands make room for queued ones
+        self.check(monotonic())
+        self.launch_pending(monotonic())
+        try:
+            events = self.poller.poll(self.poll_timeout(monotonic()))
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            events = []
+        for (fd, flags) in events:
+            if fd == self.wake_r:
+                try:
+                    os.read(self.wake_r, BUFSIZE)
+                except OSError:
+                    pass
+                continue
+            cmd = self.fds.get(fd)
+            if cmd is not None:
+                self.read(cmd, fd)
+
+    def loop(self):
+        while True:
+            try:
+                self.step()
+            except Exception as e:
+                # Don't leave handlers waiting on commands nobody runs
+                self.fail_all(e)
+
+executor = CommandExecutor()
+
+def run_command(args, timeout=DEFAULT_TIMEOUT, max_output=DEFAULT_MAX_OUTPUT,
+                shell=False):
+    '''
+    Runs a command through the shared executor and returns its (output,
+    error). Raises TimeoutError or OutputLimitError, with what the command
+    had written until then, if it is killed for running too long or
+    writing too much. With timeout=None the command runs to completion.
+    '''
+    return executor.run(args, timeout, max_output, shell).result()
+
+def timed_communicate(proc, timeout=DEFAULT_TIMEOUT):
+    return executor.adopt(proc, timeout).result()
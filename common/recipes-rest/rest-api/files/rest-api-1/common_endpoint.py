@@ -27,6 +27,7 @@ import rest_modbus
 import rest_slotid
 import rest_psu_update
 import rest_fcpresent
+import rest_batch
 import bottle
 
 commonApp = bottle.Bottle()
@@ -205,6 +206,14 @@ def rest_fcpresent_hdl():
     return rest_fcpresent.get_fcpresent()
 
 
+# Handler for batch requests: runs the GET handlers of a list of resource
+# paths of this server concurrently
+@commonApp.route('/api/batch', method='POST')
+def rest_batch_hdl():
+    data = json.load(bottle.request.body)
+    return rest_batch.run_batch(bottle.request.app, data)
+
+
 @commonApp.route('/api/sys/modbus_registers')
 def modbus_registers_hdl():
     return rest_modbus.get_modbus_registers()
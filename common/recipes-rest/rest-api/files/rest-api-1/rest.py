@@ -25,6 +25,7 @@ import datetime
 import logging
 import logging.config
 from rest_config import RestConfig
+import bmc_command
 from common_endpoint import commonApp
 from board_endpoint import boardApp
 
@@ -112,6 +113,10 @@ bottle._stderr = logging.error
 bottle._stdout = logging.info
 logging.config.dictConfig(LOGGER_CONF)
 
+# Handlers wait for their commands; let SIGCHLD tell the executor when the
+# commands exit
+bmc_command.executor.install_sigchld()
+
 serverApp = bottle.app()
 serverApp.merge(commonApp)
 serverApp.merge(boardApp)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# Copyright 2014-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Batch requests: runs the GET handlers of a list of resource paths
+# concurrently and returns all of their results in one document, so a
+# collector can scrape the whole box in a single round-trip. Handlers take
+# their own hardware locks (btools' bus locks, bmc_command's concurrency
+# limit), so resources on different devices are read in parallel and those
+# sharing one are serialized as they would be across separate requests.
+
+import Queue
+import threading
+from bottle import HTTPError
+from bmc_command import monotonic
+
+MAX_ITEMS = 64
+WORKERS = 8
+QUEUE_SIZE = 2 * MAX_ITEMS
+TIMEOUT = 30.0
+
+BATCH_PATH = '/api/batch'
+
+
+class Batch(object):
+    def __init__(self):
+        self.results = Queue.Queue()
+        self.abandoned = threading.Event()
+
+
+class BatchRunner(object):
+    '''
+    Runs batch items on a fixed pool of worker threads. At most queue_size
+    items wait for a worker; a batch that doesn't fit is turned away.
+    '''
+    def __init__(self, workers, queue_size):
+        self.jobs = Queue.Queue(queue_size)
+        for i in range(workers):
+            t = threading.Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+
+    def worker(self):
+        while True:
+            (app, path, index, batch) = self.jobs.get()
+            # Nobody is waiting for it anymore
+            if batch.abandoned.is_set():
+                continue
+            batch.results.put((index, run_item(app, path)))
+
+    def run(self, app, paths, timeout):
+        '''
+        Returns one item per path, in order. Items that don't finish within
+        timeout seconds are reported with status 504; the ones still queued
+        by then are dropped, those already running keep running to
+        completion in the background.
+        '''
+        batch = Batch()
+        try:
+            for (index, path) in enumerate(paths):
+                self.jobs.put((app, path, index, batch), False)
+        except Queue.Full:
+            batch.abandoned.set()
+            raise HTTPError(503, {'error': 'busy'})
+        items = [None] * len(paths)
+        pending = len(paths)
+        deadline = monotonic() + timeout
+        while pending:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                (index, item) = batch.results.get(True, remaining)
+            except Queue.Empty:
+                break
+            items[index] = item
+            pending -= 1
+        batch.abandoned.set()
+        for (index, path) in enumerate(paths):
+            if items[index] is None:
+                items[index] = {'path': path, 'status': 504,
+                                'time_ms': timeout * 1000, 'result': None}
+        return items
+
+
+def run_item(app, path):
+    start = monotonic()
+    try:
+        if path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+            raise HTTPError(400, 'Batches cannot be nested')
+        environ = {'REQUEST_METHOD': 'GET',
+                   'PATH_INFO': path.split('?', 1)[0]}
+        (route, args) = app.router.match(environ)
+        result = route.callback(**args)
+        status = 200
+    except HTTPError as e:
+        result = e.body
+        status = e.status_code
+    except Exception as e:
+        result = str(e)
+        status = 500
+    return {'path': path, 'status': status,
+            'time_ms': (monotonic() - start) * 1000, 'result': result}
+
+
+runner = None
+runner_lock = threading.Lock()
+
+def get_runner():
+    global runner
+    with runner_lock:
+        if runner is None:
+            runner = BatchRunner(WORKERS, QUEUE_SIZE)
+    return runner
+
+
+def run_batch(app, data):
+    '''
+    data is either a list of resource paths or {"resources": [...],
+    "timeout": seconds}
+    '''
+    if isinstance(data, dict):
+        paths = data.get('resources')
+        timeout = data.get('timeout', TIMEOUT)
+    else:
+        paths = data
+        timeout = TIMEOUT
+    if (not isinstance(paths, list) or
+            not all(isinstance(p, basestring) for p in paths)):
+        raise HTTPError(400, {'error': 'resources must be a list of paths'})
+    if len(paths) > MAX_ITEMS:
+        raise HTTPError(400, {'error': 'too_many_resources',
+                              'max': MAX_ITEMS})
+    try:
+        timeout = min(float(timeout), TIMEOUT)
+    except (TypeError, ValueError):
+        raise HTTPError(400, {'error': 'timeout must be a number'})
+    if not timeout > 0:
+        raise HTTPError(400, {'error': 'timeout must be positive'})
+
+    start = monotonic()
+    items = get_runner().run(app, paths, timeout)
+    result = {
+        "Information": {
+            "Description": "Batch of %d resources" % len(paths),
+            "Time_ms": (monotonic() - start) * 1000,
+            "Results": items,
+        },
+        "Actions": [],
+        "Resources": [],
+    }
+    return result
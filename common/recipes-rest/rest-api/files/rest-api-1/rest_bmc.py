@@ -30,53 +30,77 @@ import sys
 import subprocess
 import bmc_command
 
-lock = threading.Lock()
+# btools takes its own locks on the I2C buses it uses, so handlers for
+# different buses run concurrently. Their output is captured per thread.
+class ThreadStdout(object):
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def write(self, s):
+        buf = getattr(self.local, 'buffer', None)
+        if buf is None:
+            self.stdout.write(s)
+        else:
+            buf.write(s)
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+stdout_lock = threading.Lock()
 
 class Capturing(list):
     def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = StringIO()
+        with stdout_lock:
+            if not isinstance(sys.stdout, ThreadStdout):
+                sys.stdout = ThreadStdout(sys.stdout)
+        self._local = sys.stdout.local
+        self._outer = getattr(self._local, 'buffer', None)
+        self._local.buffer = self._stringio = StringIO()
         return self
     def __exit__(self, *args):
         self.extend(self._stringio.getvalue().splitlines())
         del self._stringio    # free up some memory
-        sys.stdout = self._stdout
+        self._local.buffer = self._outer
 
 
+# As in rest_fruid and rest_sensors, a command that times out or writes too
+# much is handled with what it printed until then. The error is appended,
+# so handlers looking for "Error" in the output report the failure.
+def run_shell(cmd):
+    try:
+        return bmc_command.run_command(cmd, shell=True)[0]
+    except (bmc_command.TimeoutError, bmc_command.OutputLimitError) as ex:
+        return '%s\nError: %s' % (ex.output, str(ex))
+
 # Handler for FRUID resource endpoint
 def get_bmc():
     # Get BMC Reset Reason
-    (wdt_counter, _) = Popen('devmem 0x1e785010', \
-                             shell=True, stdout=PIPE).communicate()
-    wdt_counter = int(wdt_counter, 0)
-
-    wdt_counter &= 0xff00
+    wdt_counter = run_shell('devmem 0x1e785010')
+    try:
+        wdt_counter = int(wdt_counter, 0)
+    except ValueError:
+        wdt_counter = None
 
-    if wdt_counter:
-        por_flag = 0
+    if wdt_counter is None:
+        reset_reason = "Unknown"
+    elif wdt_counter & 0xff00:
+        reset_reason = "User Initiated Reset or WDT Reset"
     else:
-        por_flag = 1
-
-    if por_flag:
         reset_reason = "Power ON Reset"
-    else:
-        reset_reason = "User Initiated Reset or WDT Reset"
 
     # Get BMC's Up Time
-    (uptime, _) = Popen('uptime', \
-                        shell=True, stdout=PIPE).communicate()
+    uptime = run_shell('uptime')
 
     # Get Usage information
-    (data, _) = Popen('top -b n1', \
-                        shell=True, stdout=PIPE).communicate()
+    data = run_shell('top -b n1')
     adata = data.split('\n')
     mem_usage = adata[0]
     cpu_usage = adata[1]
 
     # Get OpenBMC version
     version = ""
-    (data, _) = Popen('cat /etc/issue', \
-                        shell=True, stdout=PIPE).communicate()
+    data = run_shell('cat /etc/issue')
     ver = re.search(r'.* (\w+\.\w+\.\w+).*', data)
     if ver:
         version = ver.group(1)
@@ -96,86 +120,48 @@ def get_bmc():
 
     return result;
 
-def find_err_status(data):
-
-    err_status = "exit status"
-    err = 0
-    for item in data.split('\''):
-        if err_status in item:
-            try:
-                err = int(item.strip()[-3:-2])
-                return err
-            except Exception as e:
-                #default error if i2c failure 2
-                err = 2
-                return 2
-
-    return err
+# btools' i2c failures are reported with the exit status of the first
+# failed command, incomplete readings as 3
+def reading_errors(readings):
+    for r in readings:
+        if r['errors']:
+            return r['status']
+    return 0
 
 def get_bmc_tmp(param1):
 
-    lock.acquire()
-    l = []
     output = []
     err = 0
-    err_status = "exit status"
     platform = btools.get_project()
 
-    arg = ['btools.py', '--TMP', 'sh']
-
     # ignore the input of project name field
     print "Auto detection, ignore %s" % str(param1)
 
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err = find_err_status(data)
-
-    for t in data.split():
-        try:
-            l.append(float(t))
-        except ValueError:
-            pass
-        except Exception as e:
-            l.append(float(0))
-            pass
-
-    output.append(err)
-
-    if platform == "mavericks" or platform == "mavericks-p0c":
-        try:
-            for i in range(0, 9):
-                output.append(int(l[2*i + 1] * 10))
+    try:
+        tmp = btools.read_tmp(platform)
+    except ValueError:
+        tmp = None
+
+    if tmp is not None:
+        lower = tmp['lower']
+        if 'upper' in tmp:
+            upper = tmp['upper']
+            err = reading_errors([lower, upper])
             #Max device temperature
-            output.append(int(l[19] * 10))
-        except Exception as e:
-            #fill all 0 when error
-            output = []
-            if len(l) != 20:
-               err = 3
-            output.append(err)
-            for i in range(0, 10):
-                output.append(int(0))
-            pass
-
-    if platform == "montara" or platform == "newport" or platform == "stinson" or platform == "davenport":
-        try:
-            for i in range(0, 5):
-                output.append(int(l[2*i + 1] * 10))
+            values = lower['sensors'] + upper['sensors'] + [upper['tofino']]
+        else:
+            err = reading_errors([lower])
             #Max device temperature
-            output.append(int(l[11] * 10))
-        except Exception as e:
+            values = lower['sensors'] + [lower['tofino']]
+        if None in values:
             #fill all 0 when error
-            output = []
-            if len(l) != 12:
-                err = 3
-            output.append(err)
-            for i in range(0, 6):
-                output.append(int(0))
-            pass
+            err = 3
+            values = [0] * len(values)
+        output.append(err)
+        for v in values:
+            output.append(int(v * 10))
+    else:
+        output.append(err)
 
     result = {
                 "Information": {"Description": output},
@@ -183,53 +169,32 @@ def get_bmc_tmp(param1):
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 def get_bmc_ucd():
 
-    lock.acquire()
-    l = []
     output = []
     err = 0
-    err_status = "exit status"
     platform = btools.get_project()
-    valid_range = 12
-
-    arg = ['btools.py', '--UCD', 'sh', 'v']
-
-    if platform == "mavericks-p0c" or platform == "newport" or platform == "stinson" or platform == "davenport":
-        valid_range = 16
-    if platform == "mavericks":
-        valid_range = 15
-    if platform == "montara":
-        valid_range = 12
-
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err = find_err_status(data)
-    output.append(err)
 
     try:
-        t = re.findall('\d+\.\d+', data)
-        for i in range (0, valid_range):
-            l.append(float(t[i]))
-        for i in range(0, valid_range):
-            output.append(int(l[i] * 1000))
-    except Exception as e:
+        rails = btools.read_ucd_rails(platform)
+        values = [r['voltage'] for r in rails]
+        for r in rails:
+            if r['error']:
+                err = r['status']
+                break
+    except ValueError:
+        values = [None] * 12
+
+    if None in values:
+        #If the information is incomplete, err = 3
         #fill all 0 when error
-        output = []
-        if len(t) != valid_range:
-            #If the information is incomplete, err = 3
-            err = 3
-        output.append(err)
-        for i in range(0, valid_range):
-            output.append(int(0))
-        pass
+        err = 3
+        values = [0] * len(values)
+    output.append(err)
+    for v in values:
+        output.append(int(v * 1000))
 
     result = {
                 "Information": {"Description": output},
@@ -237,12 +202,10 @@ def get_bmc_ucd():
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 def run_btools(p_len, param1, param2, param3, param4):
 
-    lock.acquire()
     output = []
 
     #Parsing input parameters
@@ -277,12 +240,10 @@ def run_btools(p_len, param1, param2, param3, param4):
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 def get_bmc_ps_feature(param1, param2):
 
-    lock.acquire()
     output = []
     if param2 == "presence":
         try:
@@ -298,239 +259,24 @@ def get_bmc_ps_feature(param1, param2):
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 
-def get_bmc_ps_old(param1):
-
-    lock.acquire()
-    l = []
-    j = []
-    output = []
-    load_sharing = []
-    err = [0] * 11
-    err_status = "exit status"
-    not_present = "not_present"
+def get_bmc_ps_presence(param1):
     try:
         r = btools.psu_check_pwr_presence(int(param1))
         if r != 0 :
             # 0. error status
-            output.append("0")
-            output.append("absent")
-            result = {
-                "Information": {"Description": output},
-                "Actions": [],
-                "Resources": [],
-                 }
-            lock.release()
-            return result;
+            return ["0", "absent"]
     except Exception as e:
         print("get presence error:")
         print(e)
         # 1. error status
-        output.append("1")
-        output.append("read present fail")
-        result = {
-                "Information": {"Description": output},
-                "Actions": [],
-                "Resources": [],
-             }
-        lock.release()
-        return result;
-
-    # input voltage data
-    arg = ['btools.py', '--PSU', '1', 'r', 'v']
-    arg[2] = str(param1)
-
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[0] = find_err_status(data)
-
-    try:
-        t = re.findall('\d+\.\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    # output voltage
-    arg[4] = 'vo'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[1] = find_err_status(data)
-
-    # ouput voltage data
-    try:
-        t = re.findall('\d+\.\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    # input current
-    arg[4] = 'i'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[2] = find_err_status(data)
-
-    try:
-        t = re.findall('\d+\.\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    #  power supply
-    arg[4] = 'p'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[3] = find_err_status(data)
-
-    try:
-        t = re.findall('\d+\.\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    # fan speed
-    arg[4] = 'fspeed'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[4] = find_err_status(data)
-
-    try:
-        t = re.findall('\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    # fan fault
-    arg[4] = 'ffault'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[5] = find_err_status(data)
-
-    try:
-        t = re.findall('\d+', data)
-        l.append(float(t[0]))
-    except Exception as e:
-        l.append(float(0))
-        pass
-
-    # presence
-    arg[4] = 'presence'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[6] = find_err_status(data)
-
-    if not_present in data:
-        l.append(float(0))
-    else :
-        l.append(float(1))
-
-    #  load sharing
-    arg[4] = 'ld'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[7] = find_err_status(data)
-
-    # if current is shared between supplies then load sharing
-    # is true
-    try :
-        t = re.findall('\d+\.\d+', data)
-        if float(t[0]) > 0.0 and float(t[1]) > 0.0 :
-            l.append(float(1))
-        else :
-            l.append(float(0))
-    except Exception as e:
-        l.append(float(0))
-
+        return ["1", "read present fail"]
+    return None
 
-    # ps model
-    arg[4] = 'psmodel'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[8] = find_err_status(data)
-
-    try:
-        t = re.findall('[\w\.-]+', data)
-        j.append(t[0])
-    except Exception as e:
-        j.append("Error")
-        pass
-
-    # ps serial
-    arg[4] = 'psserial'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-        err[9] = find_err_status(data)
-
-    try:
-        t = re.findall('[\w\.-]+', data)
-        j.append(t[0])
-    except Exception as e:
-        j.append("Error")
-        pass
-
-    # ps verion
-    arg[4] = 'psrev'
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    # if error while data collection
-    if err_status in data:
-      err[10] = find_err_status(data)
-
-    try:
-        t = re.findall('[\w\.-]+', data)
-        j.append(t[0])
-    except Exception as e:
-        j.append("Error")
-        pass
+def ps_description(values, err):
+    output = []
 
     #if err is present append it to output
     a = 0
@@ -541,10 +287,28 @@ def get_bmc_ps_old(param1):
 
     output.append(a)
 
-    for x in l:
-        output.append(int(x))
-    for x in j:
-        output.append(x)
+    for i in range(8):
+        output.append(int(values[i]))
+    for j in range(8, 11):
+        output.append(values[j])
+
+    return output
+
+def get_bmc_ps_old(param1):
+
+    output = get_bmc_ps_presence(param1)
+    if output is None:
+        values = [0, 0, 0, 0, 0, 0, 0, 0, 'Error', 'Error', 'Error']
+        err = [0] * 11
+        ps = btools.read_psu(int(param1))
+        for i in range(11):
+            v = ps[btools.PSU_ATTRS[i]]
+            if v is None:
+                #default error if i2c failure 2
+                err[i] = 2
+            else:
+                values[i] = v
+        output = ps_description(values, err)
 
     result = {
                 "Information": {"Description": output},
@@ -552,151 +316,21 @@ def get_bmc_ps_old(param1):
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 def get_bmc_ps(param1):
-    vlist = [0, 0, 0, 0, 0, 0, 0, 0,  'Error', 'Error', 'Error']
-    lock.acquire()
-    output = []
-    err = [1] * 11
-    try:
-        r = btools.psu_check_pwr_presence(int(param1))
-        if r != 0 :
-            # 0. error status
-            output.append("0")
-            output.append("absent")
-            result = {
-                "Information": {"Description": output},
-                "Actions": [],
-                "Resources": [],
-                 }
-            lock.release()
-            return result;
-    except Exception as e:
-        print("get presence error:")
-        print(e)
-        # 1. error status
-        output.append("1")
-        output.append("read present fail")
-        result = {
-                "Information": {"Description": output},
-                "Actions": [],
-                "Resources": [],
-             }
-        lock.release()
-        return result;
-
-    # input voltage data
-    arg = ['btools.py', '--PSU', '1', 'a', 'v']
-    arg[2] = str(param1)
-
-    with Capturing() as screen_op:
-        btools.main(arg)
-    data = str(screen_op)
-
-    for line in data.split(','):
-        if line.find('in0_input') != -1:
-          try:
-            t = re.findall('\d+\.\d+', line[len('in0_input'):])
-            vlist[0] = float(t[0])
-            err[0] = 0
-          except Exception as e:
-            pass
-        elif line.find('in1_input') != -1:
-          try:
-            t = re.findall('\d+\.\d+', line[len('in1_input'):])
-            vlist[1] = float(t[0])
-            err[1] = 0
-          except Exception as e:
-            pass
-        elif line.find('curr1_input') != -1:
-          try:
-            t = re.findall('\d+\.\d+', line[len('curr1_input'):])
-            vlist[2] = float(t[0])
-            err[2] = 0
-          except Exception as e:
-            pass
-        elif line.find('power1_input') != -1:
-          try:
-            t = re.findall('\d+\.\d+', line[len('power1_input'):])
-            vlist[3] = float(t[0])
-            err[3] = 0
-          except Exception as e:
-            pass
-        elif line.find('fan1_input') != -1:
-          try:
-            t = re.findall('\d+', line[len('fan1_input'):])
-            vlist[4] = int(t[0])
-            err[4] = 0
-          except Exception as e:
-            pass
-        elif line.find('fan1_fault') != -1:
-          try:
-            t = re.findall('\d+', line[len('fan1_fault'):])
-            vlist[5] = int(t[0])
-            err[5] = 0
-          except Exception as e:
-            pass
-        elif line.find('present') != -1:
-          try:
-            if line.find('error') != -1:
-              vlist[6] = 0
-            elif line.find('not') != -1:
-              err[6] = 0
-            else:
-              vlist[6] = 1
-              err[6] = 0
-          except Exception as e:
-            pass
-        elif line.find('curr2_input') != -1:
-          try:
-            if line.find('error') != -1:
-              vlist[7] = 0
-            else:
-              t = re.findall('\d+', line[len('curr2_input'):])
-              vlist[7] = int(t[0])
-              err[7] = 0
-          except Exception as e:
-            pass
-        elif line.find('mfr_model_label') != -1:
-          try:
-            aline = line.split(': ', 1)
-            t = re.findall('[\w\.-]+', aline[1])
-            vlist[8] = str(t[0])
-            err[8] = 0
-          except Exception as e:
-            pass
-        elif line.find('mfr_serial_label') != -1:
-          try:
-            aline = line.split(': ', 1)
-            t = re.findall('[\w\.-]+', aline[1])
-            vlist[9] = str(t[0])
-            err[9] = 0
-          except Exception as e:
-            pass
-        elif line.find('mfr_revision') != -1:
-          try:
-            aline = line.split(': ', 1)
-            t = re.findall('[\w\.-]+', aline[1])
-            vlist[10] = str(t[0])
-            err[10] = 0
-          except Exception as e:
-            pass
-
-    #if err is present append it to output
-    a = 0
-    for x in err:
-        if x != 0:
-            a = x
-            break
 
-    output.append(a)
-
-    for i in range(8):
-        output.append(int(vlist[i]))
-    for j in range(8, 11):
-        output.append(vlist[j])
+    output = get_bmc_ps_presence(param1)
+    if output is None:
+        values = [0, 0, 0, 0, 0, 0, 0, 0, 'Error', 'Error', 'Error']
+        err = [1] * 11
+        ps = btools.read_psu(int(param1))
+        for i in range(11):
+            v = ps[btools.PSU_ATTRS[i]]
+            if v is not None:
+                values[i] = v
+                err[i] = 0
+        output = ps_description(values, err)
 
     result = {
                 "Information": {"Description": output},
@@ -704,14 +338,12 @@ def get_bmc_ps(param1):
                 "Resources": [],
              }
 
-    lock.release()
     return result;
 
 def get_fan_present(param1):
     p1=-1
     cmd = "/usr/local/bin/get_fantray_present.sh"
-    data = Popen(cmd, \
-                       shell=True, stdout=PIPE).stdout.read()
+    data = run_shell(cmd)
     try:
       t = re.findall(str(param1)+' present: 0x[0-9A-F]+', data, re.I)
       v = re.findall(r'0x[0-9A-F]+', t[0], re.I)
@@ -731,8 +363,7 @@ def get_bmc_fan(param1):
 
     platform = btools.get_project()
     cmd = "/usr/local/bin/get_fan_speed.sh %s" % param1
-    data = Popen(cmd, \
-                       shell=True, stdout=PIPE).stdout.read()
+    data = run_shell(cmd)
 
     # if error while data collection
     if any(x in data for x in error):
@@ -761,8 +392,7 @@ def get_bmc_fan(param1):
     if platform == "newport" or platform == "stinson" or platform == "davenport":
         data1 = data
         cmd = "/usr/local/bin/get_fantray_present.sh"
-        data = Popen(cmd, \
-                       shell=True, stdout=PIPE).stdout.read()
+        data = run_shell(cmd)
         t = re.findall('\d+', data)
         length=len(t)
         i=1
@@ -849,8 +479,7 @@ def set_bmc_fan(param1, param2, param3):
     else:
         cmd = "/usr/local/bin/set_fan_speed.sh %s %s %s" % (param3, param2, param1)
 
-    data = Popen(cmd, \
-                      shell=True, stdout=PIPE).stdout.read()
+    data = run_shell(cmd)
 
     # if error while data collection
     if any(x in data for x in error):
@@ -876,7 +505,7 @@ def get_bmc_fan_led(param1):
         platform = "Mavericks"
     try:
       cmd = "/usr/local/bin/get_fan_led.sh %s %s" % (param1, platform.capitalize())
-      data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
+      data = run_shell(cmd)
       t = re.findall('0x\d+', data)
       if len(t) == 2:
         output.append(err)
@@ -908,7 +537,7 @@ def set_bmc_fan_led(param1, param2, param3):
         platform = "Mavericks"
     try:
       cmd = "/usr/local/bin/set_fan_led.sh %s %s %s %s" % (param1, param2, param3, platform.capitalize())
-      data = Popen(cmd, shell=True, stdout=PIPE).stdout.read()
+      data = run_shell(cmd)
       t = re.findall('0x0', data)
       if len(t) == 0:
         err = 1
@@ -931,8 +560,7 @@ def set_bmc_all_fan(param1):
 
     cmd = "/usr/local/bin/set_fan_speed.sh %s" % (param1)
 
-    data = Popen(cmd, \
-                      shell=True, stdout=PIPE).stdout.read()
+    data = run_shell(cmd)
 
     # if error while data collection
     if any(x in data for x in error):
@@ -953,8 +581,7 @@ def get_bmc_sensors(args):
     error = ["error", "Error", "ERROR"]
     err = 0
     cmd = "/usr/bin/sensors %s" %(args)
-    data = Popen(cmd, \
-                      shell=True, stdout=PIPE).stdout.read()
+    data = run_shell(cmd)
 
     output.append(data)
 
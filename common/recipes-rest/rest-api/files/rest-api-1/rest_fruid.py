@@ -20,30 +20,47 @@
 
 import json
 import re
-import subprocess
 import bmc_command
+import fruid_cache
+from rest_config import RestConfig
 
-# Handler for FRUID resource endpoint
-def get_fruid(cmd=['weutil']):
+# The EEPROM weutil reads is set in rest.cfg, platforms that build
+# libwedge-eeprom with another FBW_EEPROM_FILE override it there. Without
+# it the FRUID is only cached until the next recheck.
+def weutil_eeprom():
+    if RestConfig.has_option('fruid', 'eeprom'):
+        return RestConfig.get('fruid', 'eeprom')
+    return None
+
+def read_fruid(cmd):
     result = {}
-    proc = subprocess.Popen(cmd,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
     try:
-        data, err = bmc_command.timed_communicate(proc)
-    except bmc_command.TimeoutError as ex:
+        data, err = bmc_command.run_command(cmd)
+    except (bmc_command.TimeoutError, bmc_command.OutputLimitError) as ex:
         data = ex.output
         err = ex.error
 
     # need to remove the first info line from weutil
     adata = data.split('\n', 1)
+    if len(adata) < 2:
+        return result
     for sdata in adata[1].split('\n'):
         tdata = sdata.split(':', 1)
         if (len(tdata) < 2):
             continue
         result[tdata[0].strip()] = tdata[1].strip()
+    return result
+
+# Handler for FRUID resource endpoint
+def get_fruid(cmd=['weutil']):
+    if cmd == ['weutil']:
+        eeprom = weutil_eeprom()
+    else:
+        eeprom = None
+    result = fruid_cache.cache.get(' '.join(cmd), eeprom,
+                                   lambda: read_fruid(cmd))
     fresult = {
-                "Information": result,
+                "Information": dict(result),
                 "Actions": [],
                 "Resources": [],
               }
@@ -20,18 +20,14 @@
 
 import json
 import re
-import subprocess
 import bmc_command
 
 # Handler for sensors resource endpoint
 def get_sensors():
     result = []
-    proc = subprocess.Popen(['sensors'],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
     try:
-        data, err = bmc_command.timed_communicate(proc)
-    except bmc_command.TimeoutError as ex:
+        data, err = bmc_command.run_command(['sensors'])
+    except (bmc_command.TimeoutError, bmc_command.OutputLimitError) as ex:
         data = ex.output
         err = ex.error
 
@@ -20,13 +20,28 @@
 
 
 import os
-from subprocess import *
+import bmc_command
+
+# wedge_power.sh on/off/reset sequence the uServer's power rails, killing
+# them halfway could leave it in a bad state: they get no deadline.
+def wedge_power(arg, timeout=bmc_command.DEFAULT_TIMEOUT):
+    try:
+        (ret, _) = bmc_command.run_command(
+                '/usr/local/bin/wedge_power.sh ' + arg,
+                timeout=timeout, shell=True)
+    except (bmc_command.TimeoutError, bmc_command.OutputLimitError) as ex:
+        ret = ex.output
+    return ret
+
+def power_status():
+    ret = wedge_power('status').rsplit()
+    if not ret:
+        return 'unknown'
+    return ret[-1]
 
 # Handler for uServer resource endpoint
 def get_server():
-    (ret, _) = Popen('/usr/local/bin/wedge_power.sh status', \
-                     shell=True, stdout=PIPE).communicate()
-    status = ret.rsplit()[-1]
+    status = power_status()
 
     result = {
                 "Information": { "status": status },
@@ -38,23 +53,18 @@ def get_server():
 
 def server_action(data):
     if data["action"] == 'power-on':
-        (ret, _) = Popen('/usr/local/bin/wedge_power.sh status', \
-                         shell=True, stdout=PIPE).communicate()
-        status = ret.rsplit()[-1]
+        status = power_status()
         if status == 'on':
             res = 'failure'
             reason = 'already on'
         else:
-            (ret, _) = Popen('/usr/local/bin/wedge_power.sh on', \
-			shell=True, stdout=PIPE).communicate()
+            wedge_power('on', timeout=None)
             res = "success"
     elif data["action"] == 'power-off':
-        (ret, _) = Popen('/usr/local/bin/wedge_power.sh off', \
-			 shell=True, stdout=PIPE).communicate()
+        wedge_power('off', timeout=None)
         res = "success"
     elif data["action"] == 'power-reset':
-        (ret, _) = Popen('/usr/local/bin/wedge_power.sh reset', \
-			 shell=True, stdout=PIPE).communicate()
+        wedge_power('reset', timeout=None)
         res = "success"
     else:
         res = 'failure'
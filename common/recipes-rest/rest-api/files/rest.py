@@ -21,44 +21,47 @@
 from ctypes import *
 from bottle import route, run, template, request, response, ServerAdapter
 from bottle import abort
-from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
+from cherrypy.wsgiserver import CherryPyWSGIServer
+from cherrypy.wsgiserver.ssl_builtin import BuiltinSSLAdapter
+import argparse
 import json
-import ssl
-import socket
 import os
-from tree import tree
+from cache import ResponseCache
+from tree import tree, PathIndex
 from node import node
 from plat_tree import init_plat_tree
 
 CONSTANTS = {
     'certificate': '/usr/lib/ssl/certs/rest_server.pem',
+    'workers': 16,
 }
 
 root = init_plat_tree()
+index = PathIndex(root)
+cache = ResponseCache()
 
 # Generic router for incoming requests
 @route('/<path:path>', method='ANY')
 def url_router(path):
-    token = path.split('/')
     # Find the Node
-    r = root
-    for t in token:
-        r = r.getChildByName(t)
-        if r == None:
-            return r
+    built = index.generation
+    entry = index.lookup(path)
+    if index.generation != built:
+        # Tree changed (e.g. a slot was hot-plugged), start afresh
+        cache.clear()
+    if entry == None:
+        return None
+    (r, resources) = entry
     c = r.data
 
     # Handle GET request
     if request.method == 'GET':
-        # Gather info/actions directly from respective node
-        info = c.getInformation()
+        # Gather info/actions from respective node, or recent info from the
+        # cache; concurrent requests for the same path share one call
+        info = cache.get(path, c.cache_ttl, c.getInformation)
         actions = c.getActions()
 
-        # Create list of resources from tree structure
-        resources = []
-        ca = r.getChildren()
-        for t in ca:
-            resources.append(t.name)
+        # List of resources comes precomputed with the tree structure
         result = {'Information': info,
                   'Actions': actions,
                   'Resources': resources }
@@ -67,39 +70,43 @@ def url_router(path):
 
     # Handle POST request
     if request.method == 'POST':
-        return c.doAction(json.load(request.body))
+        try:
+            return c.doAction(json.load(request.body))
+        finally:
+            # Actions change what the resource and the ones below it show
+            cache.invalidate(path)
 
     return None
 
-run(host = "::", port = 8080)
-
-# TODO: Test the https connection with proper certificates
-# SSL Wrapper for Rest API
-class SSLWSGIRefServer(ServerAdapter):
+# Serves requests on a pool of worker threads with HTTP/1.1 keep-alive, so a
+# slow sensor-util for one slot doesn't hold up requests for the others.
+# Binding to "::" accepts IPv4 clients as well.
+class PooledServer(ServerAdapter):
     def run(self, handler):
-        if self.quiet:
-            class QuietHandler(WSGIRequestHandler):
-                def log_request(*args, **kw): pass
-            self.options['handler_class'] = QuietHandler
-
-        # IPv6 Support
-        server_cls = self.options.get('server_class', WSGIServer)
-
-        if ':' in self.host:
-            if getattr(server_cls, 'address_family') == socket.AF_INET:
-                class server_cls(server_cls):
-                    address_family = socket.AF_INET6
+        server = CherryPyWSGIServer((self.host, self.port), handler,
+                                    numthreads=self.options['workers'])
+        # TODO: Test the https connection with proper certificates
+        if self.options.get('certificate'):
+            server.ssl_adapter = \
+                    BuiltinSSLAdapter(self.options['certificate'], None)
+        try:
+            server.start()
+        finally:
+            server.stop()
 
-        srv = make_server(self.host, self.port, handler,
-                server_class=server_cls, **self.options)
-        srv.socket = ssl.wrap_socket (
-                srv.socket,
-                certfile=CONSTANTS['certificate'],
-                server_side=True)
-        srv.serve_forever()
+parser = argparse.ArgumentParser(description='RESTful API server')
+parser.add_argument('-w', '--workers', type=int,
+                    default=CONSTANTS['workers'],
+                    help='number of requests served at the same time')
+parser.add_argument('--ssl', action='store_true',
+                    help='serve HTTPS on port 8443 instead of HTTP on 8080')
+args = parser.parse_args()
 
-# Use SSL if the certificate exists. Otherwise, run without SSL.
-if os.access(CONSTANTS['certificate'], os.R_OK):
-    run(server=SSLWSGIRefServer(host="::", port=8443))
+# Plain HTTP on 8080 unless SSL is asked for explicitly
+if args.ssl:
+    if not os.access(CONSTANTS['certificate'], os.R_OK):
+        parser.error('cannot read certificate %s' % CONSTANTS['certificate'])
+    run(server=PooledServer(host="::", port=8443, workers=args.workers,
+                            certificate=CONSTANTS['certificate']))
 else:
-    run(host = "::", port = 8080)
+    run(server=PooledServer(host="::", port=8080, workers=args.workers))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Measures the cost of resolving a request path to its resource node:
+# walking the tree with getChildByName() and building the Resources list,
+# as url_router used to, against a PathIndex lookup. The tree is shaped
+# like Yosemite's with a configurable number of server slots, e.g.:
+#
+#   router_bench.py -s 4 -n 100000
+
+import argparse
+import timeit
+from node import node
+from tree import tree, PathIndex
+
+def make_tree(slots):
+    r_api = tree("api", data = node())
+    for board, leaves in [("spb", ["fruid", "bmc", "sensors", "logs"]),
+                          ("mezz", ["fruid", "sensors", "logs"])]:
+        r_board = tree(board, data = node())
+        r_board.addChildren([tree(leaf, data = node()) for leaf in leaves])
+        r_api.addChild(r_board)
+    for i in range(1, slots + 1):
+        r_server = tree("server" + repr(i), data = node())
+        r_server.addChildren([tree(leaf, data = node())
+                              for leaf in ["fruid", "sensors", "logs",
+                                           "config"]])
+        r_api.addChild(r_server)
+    return r_api
+
+def all_paths(root, prefix = None):
+    if prefix is None:
+        path = root.name
+    else:
+        path = prefix + '/' + root.name
+    paths = [path]
+    for child in root.getChildren():
+        paths.extend(all_paths(child, path))
+    return paths
+
+def walk(root, path):
+    r = root
+    for t in path.split('/'):
+        r = r.getChildByName(t)
+        if r == None:
+            return None
+    resources = []
+    for t in r.getChildren():
+        resources.append(t.name)
+    return (r, resources)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmark REST request path resolution')
+    parser.add_argument('-s', '--slots', type=int, default=4,
+                        help='number of server slots in the tree')
+    parser.add_argument('-n', '--number', type=int, default=100000,
+                        help='lookups per method')
+    args = parser.parse_args()
+
+    root = make_tree(args.slots)
+    index = PathIndex(root)
+    paths = all_paths(root)
+    for path in paths:
+        if walk(root, path) != index.lookup(path):
+            raise Exception('index disagrees with the tree on ' + path)
+
+    rounds = max(1, args.number // len(paths))
+    count = rounds * len(paths)
+    results = {}
+    for (name, fn) in [('walk', lambda p: walk(root, p)),
+                       ('index', index.lookup)]:
+        def run():
+            for path in paths:
+                fn(path)
+        results[name] = min(timeit.repeat(run, number = rounds,
+                                          repeat = 3)) / count
+        print('%-6s %8.2f us/lookup' % (name, results[name] * 1e6))
+    print('%d paths, index is %.1fx faster' %
+          (len(paths), results['walk'] / results['index']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# fscd publishes the sensor readings it takes every few seconds to
+# SNAPSHOT_FILE; serve those instead of running sensor-util again when they
+# are recent enough. Only the file format is shared with fscd:
+#
+#   {"version": 1, "frus": {fru: {"timestamp": <time of the read>,
+#     "sensors": {sym: {"id", "name", "value", "unit", "status"}}}}}
+
+import json
+import time
+
+SNAPSHOT_FILE = '/tmp/fscd_sensors.json'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAX_AGE = 10
+
+
+def read_fru_sensors(fru, max_age=SNAPSHOT_MAX_AGE, path=SNAPSHOT_FILE):
+    '''
+    Returns fru's readings with the same keys and values as parsing
+    sensor-util output, or None if fscd doesn't read that FRU or its
+    readings are more than max_age seconds old
+    '''
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if data.get('version') != SNAPSHOT_VERSION:
+        return None
+    entry = data.get('frus', {}).get(fru)
+    if not entry or not entry['sensors']:
+        return None
+    if abs(time.time() - entry['timestamp']) > max_age:
+        return None
+    result = {}
+    for v in entry['sensors'].values():
+        key = ("%-18s (0x%X)" % (v['name'], v['id'])).strip()
+        if v['value'] is None:
+            result[key] = "NA | (%s)" % (v['status'],)
+        else:
+            result[key] = "%.2f %-5s | (%s)" % (v['value'], v['unit'] or '',
+                                                v['status'])
+    return result
@@ -20,6 +20,13 @@
 
 # Class Definition for Tree
 
+# Bumped whenever any tree changes, so a PathIndex knows to rebuild
+generation = 0
+
+def changed():
+    global generation
+    generation += 1
+
 class tree:
     def __init__(self, name, data = None):
         self.name = name
@@ -28,10 +35,16 @@ class tree:
 
     def addChild(self, child):
         self.children.append(child)
+        changed()
 
     def addChildren(self, children):
         for child in children:
             self.children.append(child)
+        changed()
+
+    def removeChild(self, child):
+        self.children.remove(child)
+        changed()
 
     def getChildren(self):
         return self.children
@@ -44,3 +57,34 @@ class tree:
             if child.name == name:
                 return child
         return None
+
+class PathIndex:
+    '''
+    Maps the full path of every node under root ('api/spb/sensors') to
+    (node, names of its children), so a request is resolved with one dict
+    lookup instead of a walk down the tree. The index is rebuilt on the
+    next lookup after any tree has changed.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.generation = None
+        self.paths = {}
+
+    def build(self):
+        built = generation
+        paths = {}
+        queue = [(self.root.name, self.root)]
+        for (path, t) in queue:
+            # Same as walking with getChildByName: the first match wins
+            if path in paths:
+                continue
+            paths[path] = (t, [child.name for child in t.children])
+            for child in t.children:
+                queue.append((path + '/' + child.name, child))
+        self.paths = paths
+        self.generation = built
+
+    def lookup(self, path):
+        if self.generation != generation:
+            self.build()
+        return self.paths.get(path)
@@ -7,16 +7,26 @@ import os
 import getopt
 import subprocess
 import bmc_command
+from bus_lock import BusLock, bus
 import os.path
 from time import sleep
 import syslog
-import fcntl
 
 h_platforms = "montara/mavericks/newport"
 h_platforms_with_p0c = "montara/mavericks/mavericks-p0c/newport/stinson"
 
 nolimit_ir_vdd_core = 0
 
+# I2C buses each group of operations goes through, locked while it runs:
+# PSUs and their mux on bus 7 plus the PSU CPLD on bus 12, the UCD on bus
+# 2, the IR regulators on bus 1 and the upper board (behind the mux on bus
+# 9), the lower board temperature sensors on bus 3 and the Tofino PVT
+# registers on bus 11.
+PSU_BUSES = [bus(7), bus(12)]
+UCD_BUSES = [bus(2)]
+IR_BUSES = [bus(1), bus(9)]
+TMP_BUSES = [bus(3), bus(9), bus(11)]
+
 #
 # btool usage for modules. Individual module usage is printed separately
 #
@@ -260,11 +270,12 @@ def psu_init():
 #function just for power supply check
 def psu_check_pwr_presence(power_supply):
 
-  s = psu_init()
-  if s == -1:
-      return -1
+  with BusLock(PSU_BUSES):
+      s = psu_init()
+      if s == -1:
+          return -1
 
-  r = psu_cpld_features(power_supply, "presence")
+      r = psu_cpld_features(power_supply, "presence")
 
   return r
 
@@ -341,20 +352,20 @@ def psu_get_ld(param):
         return 0
 
 
-def psu_all(argv):
-    arg_psu = argv[2:]
-    i2c_dev = "/sys/class/i2c-adapter/i2c-7/7-00"
-    list = ['in0_input', 'in1_input', 'curr1_input', 'power1_input', 'fan1_input', 'fan1_fault', 'presence', 'curr2_input',  'mfr_model_label', 'mfr_serial_label', 'mfr_revision']
-    unit = ['V', 'V', 'mA', 'mW', 'rpm', 'ffault', 'presence', 'A', 'model', 'serial', 'rev']
-    # Mapping i2c bus address according to power supply number
-    # 2018.09.10 Swap PSUs mapping because of reverse.
-    if arg_psu[0] == "1":
-        power_supply = 1
-        ps = "5a/"
-    elif arg_psu[0] == "2":
-        power_supply = 2
-        ps = "59/"
+#
+# Attributes of a power supply, in the order 'btools.py --PSU <n> a' shows them
+#
+PSU_ATTRS = ['in0_input', 'in1_input', 'curr1_input', 'power1_input',
+             'fan1_input', 'fan1_fault', 'presence', 'curr2_input',
+             'mfr_model_label', 'mfr_serial_label', 'mfr_revision']
+PSU_UNITS = ['V', 'V', 'mA', 'mW', 'rpm', 'ffault', 'presence', 'A',
+             'model', 'serial', 'rev']
 
+# 2018.09.10 Swap PSUs mapping because of reverse.
+PSU_SYSFS = {1: "/sys/class/i2c-adapter/i2c-7/7-005a/",
+             2: "/sys/class/i2c-adapter/i2c-7/7-0059/"}
+
+def psu_open_mux():
     try:
         I2C_ADDR = "0x70"
         I2C_BUS = "7"
@@ -364,42 +375,87 @@ def psu_all(argv):
         subprocess.check_output(["i2cset", "-f", "-y", I2C_BUS, I2C_ADDR, OPCODE_OFF])
         subprocess.check_output(["i2cset", "-f", "-y", I2C_BUS, I2C_ADDR, OPCODE_ON])
     except subprocess.CalledProcessError as e:
+        return -1
+    return 0
+
+#
+# Reads one of PSU_ATTRS. Voltages are in V, current in mA, power in mW
+# and fan speed in rpm. presence is a bool, curr2_input (load sharing) is
+# 1 if both supplies deliver current, 0 otherwise. Returns None on error.
+#
+def psu_read_attr(power_supply, attr):
+
+    if attr == 'presence':
+        r = psu_cpld_present(power_supply)
+        if r == -1:
+            return None
+        return r == 0
+    if attr == 'curr2_input':
+        ld = psu_get_ld(attr)
+        if ld < 0:
+            return None
+        return int(ld)
+
+    unit = PSU_UNITS[PSU_ATTRS.index(attr)]
+    try:
+        output = subprocess.check_output(["cat", PSU_SYSFS[power_supply] + attr])
+        if unit == "V":
+            return float(output) / 1000         # convert milli volts to volts
+        elif unit == "mA" or unit == "mW":
+            return float(output)
+        elif unit == "rpm" or unit == "ffault":
+            return int(output)
+        return output.strip()
+    except (subprocess.CalledProcessError, ValueError) as e:
+        return None
+
+#
+# Returns {attribute: value} of power supply 1 or 2, for a single attribute
+# of PSU_ATTRS or all of them. Every value is None if the supply can't be
+# reached at all.
+#
+def read_psu(power_supply, field=None):
+
+    if power_supply not in PSU_SYSFS:
+        raise ValueError("No power supply %s" % power_supply)
+    if field is None:
+        attrs = PSU_ATTRS
+    elif field in PSU_ATTRS:
+        attrs = [field]
+    else:
+        raise ValueError("Unknown power supply attribute %s" % field)
+
+    result = dict.fromkeys(attrs)
+    with BusLock(PSU_BUSES):
+        if psu_init() == -1 or psu_open_mux() == -1:
+            return result
+        for attr in attrs:
+            result[attr] = psu_read_attr(power_supply, attr)
+
+    return result
+
+def psu_all(argv):
+    power_supply = int(argv[2])
+
+    if psu_open_mux() == -1:
         print "Error while executing psu i2c command "
         return -1
 
-    for i in range(11):
-        if list[i] == 'curr2_input':
-            ld = psu_get_ld("curr2_input")
-            if ld >= 0:
-              print "{} : {} {}".format(list[i], int(ld), unit[i])
+    for i in range(len(PSU_ATTRS)):
+        value = psu_read_attr(power_supply, PSU_ATTRS[i])
+        if PSU_ATTRS[i] == 'presence':
+            if value is None:
+                print "{} : {}".format("present", "error")
+            elif value:
+                print "Power supply %s present" % power_supply
             else:
-              print "{} : {}".format(list[i], "error")
-        elif list[i] == 'presence':
-            r = psu_cpld_features(power_supply, "presence")
-            if r == -1:
-              print "{} : {}".format("present", "error")
+                print "Power supply %s not present" % power_supply
+        elif value is None:
+            print "{} : {}".format(PSU_ATTRS[i], "error")
+        elif PSU_UNITS[i] in ['V', 'mA', 'mW', 'rpm', 'A']:
+            print "{} : {} {}".format(PSU_ATTRS[i], value, PSU_UNITS[i])
         else:
-            path = i2c_dev + ps + list[i]
-            try:
-              output = subprocess.check_output(["cat", path])
-              if unit[i] == "V":
-                print "{} : {} {}".format(list[i], float(output) / 1000, unit[i])             # convert milli volts to volts
-              elif unit[i] == "mA":
-                print "{} : {} {}".format(list[i], float(output), unit[i])                   # current is in milli Amperes
-              elif unit[i] == "mW":
-                print "{} : {} {}".format(list[i], float(output), unit[i])                   # Power in milli watts
-              elif unit[i] == "rpm":
-                print "{} : {} {}".format(list[i], int(output), unit[i])                    # Speed of FAN
-              elif unit[i] == "ffault":
-                print "{} : {}".format(list[i], int(output))
-              elif unit[i] == "model":
-                print "{} : {}".format(list[i], output)
-              elif unit[i] == "serial":
-                print "{} : {}".format(list[i], output)
-              elif unit[i] == "rev":
-                print "{} : {}".format(list[i], output)
-            except subprocess.CalledProcessError as e:
-              print "{} : {}".format(list[i], "error")
+            print "{} : {}".format(PSU_ATTRS[i], value)
 
 #
 # Function to handle PSU related requests
@@ -671,417 +727,179 @@ def ucd_rail_voltage_fault(platform):
 
 
 #
-# Displays all rails voltages newport
+# Names of the UCD rails of each platform, rail 1 first
 #
-def ucd_rail_voltage_newport():
-
-    i = 1
-
-    UCD_I2C_BUS = "2"
-    UCD_I2C_ADDR = "0x34"
-    UCD_READ_OP = "0x8b"
-    UCD_PAGE_OP = "0x00"
-    UCD_VOUT_MODE_OP = "0x20"
-
-    print " "
-    print " RAIL                          Voltage(V)"
-
-    string = {1: "01** - VDD12V", 2: "02 - VDD_0_75V", 3: "03 - VDD5V_stby_IR", 4: "04 - VDD5V_stby",
-              5: "05* - VDD3_3V", 6: "06 - VDD3_3V_iso", 7: "07 - VDD3_3V_stby", 8: "08- VDD2_5V_stby",
-              9: "09- VDD1_8V", 10: "10*- VDDA_1_8V", 11: "11- VDD1_8V_stby", 12: "12- VDD1_5V_stby",
-              13: "13*- VDD1_2V", 14: "14- VDD1_2V_stby", 15: "15*- VDD1_0V", 16: "16*- VDD_core"}
-    index = 16
-
-# Parse 1 to 16 voltage rails
-    for i in range(0, index):
-
-        try:
-            set_cmd = "i2cset"
-            output = subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
-                                     UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cset for rail %.2d " % i
-            continue
-
-        try:
-            get_cmd = "i2cget"
-            mantissa = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_READ_OP, "w"])
-
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
-            continue
-
-        try:
-            # i2cget -f -y 2 0x34 0x20
-            get_cmd = "i2cget"
-            exponent = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_VOUT_MODE_OP])
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
-            continue
-
-        # 2 ^ exponent
-        # exponent is 5 bit signed value. Thus calculating first exponent.
-        # It is based on UCD90120A device spec section 2.2
-        exp = int(exponent, 16) | ~0x1f
-        exp = ~exp + 1
-        div = 1 << exp
-
-        mantissa = int(mantissa, 16)
-
-        print "  %-*s          %.3f" % (20, string.get(i + 1), float(mantissa) / float(div))
-
-    print "  "
-    print "* voltages can be margined by IR CLI only "
-    print "** voltages cannot be margined "
-    print "  "
-
-    return
+UCD_RAILS = {
+    "mavericks": ["01** - VDD12V", "02** - VDD5V_IR", "03 - VDD5V_stby",
+                  "04 - VDD3_3V_iso", "05 - VDD3_3V_stby",
+                  "06*- VDD3_3V_lower", "07*- VDD3_3V_upper",
+                  "08- VDD2_5V_stby", "09*- VDD2_5V_rptr", "10- VDD2_5V_tf",
+                  "11- VDD1_8V_stby", "12- VDD1_5V_stby", "13- VDD1_2V_stby",
+                  "14*- VDD0_9V_anlg", "15*- VDD_core"],
+    "mavericks-p0c": ["01** - VDD12V", "02** - VDD5V_IR", "03 - VDD5V_stby",
+                      "04 - VDD3_3V_iso", "05 - VDD3_3V_stby",
+                      "06*- VDD3_3V_lower", "07*- VDD3_3V_upper",
+                      "08- VDD2_5V_stby", "09*- VDD1_8V_rt", "10- VDD2_5V_tf",
+                      "11- VDD1_8V_stby", "12- VDD1_5V_stby",
+                      "13- VDD1_2V_stby", "14*- VDD0_9V_anlg",
+                      "15*- VDD_core", "16- VDD1_0V_rt"],
+    "montara": ["01-  VDD12V", "02-  VDD5V_stby", "03-  VDD3_3V_iso",
+                "04*- VDD3_3V", "05-  VDD3_3V_stby", "06-  VDD2_5V_stby",
+                "07-  VDD2_5V_tf", "08-  VDD1_8V_stby", "09-  VDD1_5V_stby",
+                "10-  VDD1_2V_stby", "11*-  VDD0_9V_anlg", "12*-  VDD_core"],
+    "newport": ["01** - VDD12V", "02 - VDD_0_75V", "03 - VDD5V_stby_IR",
+                "04 - VDD5V_stby", "05* - VDD3_3V", "06 - VDD3_3V_iso",
+                "07 - VDD3_3V_stby", "08- VDD2_5V_stby", "09- VDD1_8V",
+                "10*- VDDA_1_8V", "11- VDD1_8V_stby", "12- VDD1_5V_stby",
+                "13*- VDD1_2V", "14- VDD1_2V_stby", "15*- VDD1_0V",
+                "16*- VDD_core"],
+    "stinson": ["01** - VDD12V_FUSED_2", "02 - VDD1_1V",
+                "03** - VDD5V_stby_IR", "04 - VDD5V_stby", "05* - VDD3_3V",
+                "06** - VDD2_5V", "07 - VDD3_3V_stby", "08 - VDD2_5V_stby",
+                "09 - VDD1_2V_stby", "10 - VDD1_8V", "11 - VDD1_8V_stby",
+                "12 - VDD1_5V_stby", "13* - VDDAH_1_2V", "14* - VDDL_CORE",
+                "15* - VDDAL_0_75V", "16* - VDD_CORE"],
+    "davenport": ["01** - VDD12V_FUSED_2", "02** - VDD1_1V",
+                  "03** - VDD5V_stby_IR", "04 - VDD5V_stby", "05* - VDD3_3V",
+                  "06** - VDD2_5V", "07 - VDD3_3V_stby", "08 - VDD2_5V_stby",
+                  "09 - VDD1_2V_stby", "10 - VDD1_8V", "11 - VDD1_8V_stby",
+                  "12 - VDD1_5V_stby", "13* - VDDAH_1_2V",
+                  "14* - VDDAL_0_75V", "15* - VDDL_CORE", "16* - VDD_CORE"],
+}
+
+# Platforms on which a UCD reading of 0 or all ones is taken for a glitch
+# and read again
+UCD_RETRY = ["mavericks", "mavericks-p0c", "montara"]
+
+UCD_I2C_BUS = "2"
+UCD_I2C_ADDR = "0x34"
 
 #
-# Displays all rails voltages stinson
+# Reads a UCD register of the current page, up to 'attempts' times until
+# the value isn't one of 'invalid'. Returns (value, error), value is None
+# if no valid reading was made, error the CalledProcessError of the last
+# failed i2cget if any.
 #
-def ucd_rail_voltage_stinson():
-
-    i = 1
-
-    UCD_I2C_BUS = "2"
-    UCD_I2C_ADDR = "0x34"
-    UCD_READ_OP = "0x8b"
-    UCD_PAGE_OP = "0x00"
-    UCD_VOUT_MODE_OP = "0x20"
-
-    print " "
-    print " RAIL                          Voltage(V)"
-
-    string = {1: "01** - VDD12V_FUSED_2", 2: "02 - VDD1_1V", 3: "03** - VDD5V_stby_IR", 4: "04 - VDD5V_stby",
-              5: "05* - VDD3_3V", 6: "06** - VDD2_5V", 7: "07 - VDD3_3V_stby", 8: "08 - VDD2_5V_stby",
-              9: "09 - VDD1_2V_stby", 10: "10 - VDD1_8V", 11: "11 - VDD1_8V_stby", 12: "12 - VDD1_5V_stby",
-              13: "13* - VDDAH_1_2V", 14: "14* - VDDL_CORE", 15: "15* - VDDAL_0_75V", 16: "16* - VDD_CORE"}
-    index = 16
-# Parse 1 to 16 voltage rails
-    for i in range(0, index):
+def ucd_i2cget(args, attempts, invalid):
 
+    error = None
+    for retry in range(attempts):
+        if retry:
+            sleep(0.010)
         try:
-            set_cmd = "i2cset"
-            output = subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
-                                     UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cset for rail %.2d " % i
-            continue
-
-        try:
-            get_cmd = "i2cget"
-            mantissa = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_READ_OP, "w"])
-
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
-            continue
-
-        try:
-            # i2cget -f -y 2 0x34 0x20
             get_cmd = "i2cget"
-            exponent = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_VOUT_MODE_OP])
+            value = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
+                                             UCD_I2C_ADDR] + args)
+            value = int(value, 16)
         except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
+            error = e
             continue
+        if value not in invalid:
+            return (value, None)
 
-        # 2 ^ exponent
-        # exponent is 5 bit signed value. Thus calculating first exponent.
-        # It is based on UCD90120A device spec section 2.2
-        exp = int(exponent, 16) | ~0x1f
-        exp = ~exp + 1
-        div = 1 << exp
+    return (None, error)
 
-        mantissa = int(mantissa, 16)
-
-        print "  %-*s          %.3f" % (20, string.get(i + 1), float(mantissa) / float(div))
-
-    print "  "
-    print "* voltages can be margined by IR CLI only "
-    print "** voltages cannot be margined "
-    print "  "
-
-    return
 #
-# Displays all rails voltages stinson
+# Records the failed i2c command of a rail read by read_ucd_rails()
 #
-def ucd_rail_voltage_davenport():
-
-    i = 1
-
-    UCD_I2C_BUS = "2"
-    UCD_I2C_ADDR = "0x34"
-    UCD_READ_OP = "0x8b"
-    UCD_PAGE_OP = "0x00"
-    UCD_VOUT_MODE_OP = "0x20"
-
-    print " "
-    print " RAIL                          Voltage(V)"
-    string = {1: "01** - VDD12V_FUSED_2", 2: "02** - VDD1_1V", 3: "03** - VDD5V_stby_IR", 4: "04 - VDD5V_stby",
-              5: "05* - VDD3_3V", 6: "06** - VDD2_5V", 7: "07 - VDD3_3V_stby", 8: "08 - VDD2_5V_stby",
-              9: "09 - VDD1_2V_stby", 10: "10 - VDD1_8V", 11: "11 - VDD1_8V_stby", 12: "12 - VDD1_5V_stby",
-              13: "13* - VDDAH_1_2V", 14: "14* - VDDAL_0_75V", 15: "15* - VDDL_CORE", 16: "16* - VDD_CORE"}
-    index = 16
-
-# Parse 1 to 16 voltage rails
-    for i in range(0, index):
-
-        try:
-            set_cmd = "i2cset"
-            output = subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
-                                     UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cset for rail %.2d " % i
-            continue
-
-        try:
-            get_cmd = "i2cget"
-            mantissa = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_READ_OP, "w"])
-
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
-            continue
-
-        try:
-            # i2cget -f -y 2 0x34 0x20
-            get_cmd = "i2cget"
-            exponent = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_VOUT_MODE_OP])
-        except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for rail %.2d " % i
-            continue
-
-        # 2 ^ exponent
-        # exponent is 5 bit signed value. Thus calculating first exponent.
-        # It is based on UCD90120A device spec section 2.2
-        exp = int(exponent, 16) | ~0x1f
-        exp = ~exp + 1
-        div = 1 << exp
-
-        mantissa = int(mantissa, 16)
-
-        print "  %-*s          %.3f" % (20, string.get(i + 1), float(mantissa) / float(div))
-
-    print "  "
-    print "* voltages can be margined by IR CLI only "
-    print "** voltages cannot be margined "
-    print "  "
-
-    return
+def ucd_rail_error(rail, e, cmd):
+    if e is None:
+        return
+    rail['error'] = "%s\nError occured while processing %s for rail %.2d " % (
+            e, cmd, rail['rail'] - 1)
+    rail['status'] = e.returncode
 
 #
-# Displays all rails voltages mavericks
+# Reads the voltage of every UCD rail of platform (detected if not given).
+# Returns a list of {'rail', 'name', 'voltage', 'error', 'status'}, one per
+# rail in rail order. voltage is None for a rail that couldn't be read,
+# error then says why if an i2c command failed and status is its exit
+# status.
 #
-def ucd_rail_voltage_mavericks(poc):
+def read_ucd_rails(platform=None):
 
-    i = 1
-    UCD_I2C_BUS = "2"
-    UCD_I2C_ADDR = "0x34"
     UCD_READ_OP = "0x8b"
     UCD_PAGE_OP = "0x00"
     UCD_VOUT_MODE_OP = "0x20"
 
-    print " "
-    print " RAIL                          Voltage(V)"
+    if platform is None:
+        platform = get_project()
+    if platform not in UCD_RAILS:
+        raise ValueError("No UCD rails known for %s" % platform)
 
-    if (poc == 0):
-        string = {1: "01** - VDD12V", 2: "02** - VDD5V_IR", 3: "03 - VDD5V_stby",
-                   4: "04 - VDD3_3V_iso", 5: "05 - VDD3_3V_stby", 6: "06*- VDD3_3V_lower",
-                   7: "07*- VDD3_3V_upper", 8: "08- VDD2_5V_stby", 9: "09*- VDD2_5V_rptr",
-                   10: "10- VDD2_5V_tf", 11: "11- VDD1_8V_stby", 12: "12- VDD1_5V_stby",
-                   13: "13- VDD1_2V_stby", 14: "14*- VDD0_9V_anlg", 15: "15*- VDD_core"}
-        index = 15
+    if platform in UCD_RETRY:
+        attempts = 5
+        invalid_mantissa = [0, 65535]
+        invalid_exponent = [0, 65535, 255]
     else:
-        string = {1: "01** - VDD12V", 2: "02** - VDD5V_IR", 3: "03 - VDD5V_stby",
-                   4: "04 - VDD3_3V_iso", 5: "05 - VDD3_3V_stby", 6: "06*- VDD3_3V_lower",
-                   7: "07*- VDD3_3V_upper", 8: "08- VDD2_5V_stby", 9: "09*- VDD1_8V_rt",
-                   10: "10- VDD2_5V_tf", 11: "11- VDD1_8V_stby", 12: "12- VDD1_5V_stby",
-                   13: "13- VDD1_2V_stby", 14: "14*- VDD0_9V_anlg", 15: "15*- VDD_core",
-                   16: "16- VDD1_0V_rt"}
-        index = 16
-
-# Parse 1 to 15 voltage rails if mav p0c
-    for i in range(0, index):
-        retry0 = 0
-        err = 1
-        while ((err == 1) and (retry0 < 5)):
-            try:
-                # i2cset -f -y 2 0x34 0x00 i
-                set_cmd = "i2cset"
-                output = subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
-                                     UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
-                err = 0
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cset for rail %.2d " % i
-                err = 1
-            retry0 = retry0 + 1
-        if (err == 1):
-            continue
-
-        retry1 = 0
-        mantissa = 0
-        while (((mantissa == 0) or (mantissa == 65535)) and (retry1 < 5)):
-            try:
-                # i2cget -f -y 2 0x34 w
-                get_cmd = "i2cget"
-                mantissa = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_READ_OP, "w"])
-                mantissa = int(mantissa, 16)
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cget for rail %.2d " % i
-                mantissa = 0
-            if retry1:
-                sleep(0.010)
-                #print "retry1 %d  mantissa %s"  % (retry1, str(mantissa))
-            retry1 = retry1 + 1
-        if  (mantissa == 0) or (mantissa == 65535):
-            continue
-
-        retry2 = 0
-        exponent = 0
-        while (((exponent == 0) or (exponent == 65535) or (exponent == 255)) and (retry2 < 5)):
-            try:
-                # i2cget -f -y 2 0x34 0x20
-                get_cmd = "i2cget"
-                exponent = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_VOUT_MODE_OP])
-                exponent = int(exponent, 16)
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cget for rail %.2d " % i
-                exponent = 0
-            if retry2 :
-                sleep(0.010)
-                #print "retry2 %d  exponent %s"  % (retry2, str(exponent))
-            retry2 = retry2 + 1
-        if (exponent == 0) or (exponent == 65535) or (exponent == 255):
-            continue
+        attempts = 1
+        invalid_mantissa = []
+        invalid_exponent = []
+
+    rails = []
+    with BusLock(UCD_BUSES):
+        for i in range(len(UCD_RAILS[platform])):
+            rail = {'rail': i + 1, 'name': UCD_RAILS[platform][i],
+                    'voltage': None, 'error': None, 'status': None}
+            rails.append(rail)
+
+            for retry in range(attempts):
+                try:
+                    # i2cset -f -y 2 0x34 0x00 i
+                    set_cmd = "i2cset"
+                    subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
+                                             UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
+                    error = None
+                    break
+                except subprocess.CalledProcessError as e:
+                    error = e
+            if error:
+                ucd_rail_error(rail, error, "i2cset")
+                continue
 
-        # 2 ^ exponent
-        # exponent is 5 bit signed value. Thus calculating first exponent.
-        # It is based on UCD90120A device spec section 2.2
-        exp = exponent | ~0x1f
-        exp = ~exp + 1
-        div = 1 << exp
+            # i2cget -f -y 2 0x34 0x8b w
+            (mantissa, error) = ucd_i2cget([UCD_READ_OP, "w"], attempts,
+                                           invalid_mantissa)
+            if mantissa is None:
+                ucd_rail_error(rail, error, "i2cget")
+                continue
 
-        print "  %-*s          %.3f" % (20, string.get(i + 1), float(mantissa) / float(div))
+            # i2cget -f -y 2 0x34 0x20
+            (exponent, error) = ucd_i2cget([UCD_VOUT_MODE_OP], attempts,
+                                           invalid_exponent)
+            if exponent is None:
+                ucd_rail_error(rail, error, "i2cget")
+                continue
 
-    print "  "
-    print "* voltages can be margined by IR CLI only "
-    print "** voltages cannot be margined "
-    print "  "
+            # 2 ^ exponent
+            # exponent is 5 bit signed value. Thus calculating first exponent.
+            # It is based on UCD90120A device spec section 2.2
+            exp = exponent | ~0x1f
+            exp = ~exp + 1
+            div = 1 << exp
 
-    return
+            rail['voltage'] = float(mantissa) / float(div)
 
+    return rails
 
 #
-# Displays all rails voltages montara
+# Displays all rails voltages
 #
-def ucd_rail_voltage_montara():
-
-    i = 1
-    UCD_I2C_BUS = "2"
-    UCD_I2C_ADDR = "0x34"
-    UCD_READ_OP = "0x8b"
-    UCD_PAGE_OP = "0x00"
-    UCD_VOUT_MODE_OP = "0x20"
+def ucd_rail_voltage(platform):
 
     print " "
     print " RAIL                          Voltage(V)"
 
-    string = {1: "01-  VDD12V", 2: "02-  VDD5V_stby", 3: "03-  VDD3_3V_iso",
-              4: "04*- VDD3_3V", 5: "05-  VDD3_3V_stby", 6: "06-  VDD2_5V_stby",
-              7: "07-  VDD2_5V_tf", 8: "08-  VDD1_8V_stby", 9: "09-  VDD1_5V_stby",
-              10: "10-  VDD1_2V_stby", 11: "11*-  VDD0_9V_anlg", 12: "12*-  VDD_core"}
-    index = 12
-
-# Parse 1 to 12 voltage rails
-    for i in range(0, index):
-           
-        retry0 = 0
-        err = 1
-        while ((err == 1) and (retry0 < 5)):
-            try:
-                # i2cset -f -y 2 0x34 0x00 i
-                set_cmd = "i2cset"
-                output = subprocess.check_output([set_cmd, "-f", "-y", UCD_I2C_BUS,
-                                     UCD_I2C_ADDR, UCD_PAGE_OP, str(hex(i))])
-                err = 0
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cset for rail %.2d " % i
-                err = 1
-            retry0 = retry0 + 1
-        if (err == 1):
-            continue
-            
-        retry1 = 0
-        mantissa = 0
-        while (((mantissa == 0) or (mantissa == 65535)) and (retry1 < 5)):
-            try:
-                # i2cget -f -y 2 0x34 w
-                get_cmd = "i2cget"
-                mantissa = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_READ_OP, "w"])
-                mantissa = int(mantissa, 16)
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cget for rail %.2d " % i
-                mantissa = 0
-            if retry1:
-                sleep(0.010)
-                #print "retry1 %d  mantissa %s"  % (retry1, str(mantissa))
-            retry1 = retry1 + 1
-        if  (mantissa == 0) or (mantissa == 65535):
-            continue
-
-        retry2 = 0
-        exponent = 0
-        while (((exponent == 0) or (exponent == 65535) or (exponent == 255)) and (retry2 < 5)):
-            try:
-                # i2cget -f -y 2 0x34 0x20
-                get_cmd = "i2cget"
-                exponent = subprocess.check_output([get_cmd, "-f", "-y", UCD_I2C_BUS,
-                                               UCD_I2C_ADDR, UCD_VOUT_MODE_OP])
-                exponent = int(exponent, 16)
-            except subprocess.CalledProcessError as e:
-                print e
-                print "Error occured while processing i2cget for rail %.2d " % i
-                exponent = 0
-            if retry2 :
-                sleep(0.010)
-                #print "retry2 %d  exponent %s"  % (retry2, str(exponent))
-            retry2 = retry2 + 1
-        if (exponent == 0) or (exponent == 65535) or (exponent == 255):
-            continue
-
-        # 2 ^ exponent
-        # exponent is 5 bit signed value. Thus calculating first exponent.
-        # It is based on UCD90120A device spec section 2.2
-        exp = exponent | ~0x1f
-        exp = ~exp + 1
-        div = 1 << exp
-
-        print "  %-*s          %.3f" % (20, string.get(i + 1), float(mantissa) / float(div))
+    for rail in read_ucd_rails(platform):
+        if rail['error']:
+            print rail['error']
+        if rail['voltage'] is not None:
+            print "  %-*s          %.3f" % (20, rail['name'], rail['voltage'])
 
     print "  "
     print "* voltages can be margined by IR CLI only "
+    if platform != "montara":
+        print "** voltages cannot be margined "
     print "  "
 
     return
@@ -1293,18 +1111,8 @@ def ucd(argv):
             return
 
     if arg_ucd[0] == "sh":
-        if platform == "mavericks":
-            ucd_rail_voltage_mavericks(0)
-        elif platform == "mavericks-p0c":
-            ucd_rail_voltage_mavericks(1)
-        elif platform == "montara":
-            ucd_rail_voltage_montara()
-        elif platform == "newport":
-            ucd_rail_voltage_newport()
-        elif platform == "davenport":
-            ucd_rail_voltage_davenport()
-        elif platform == "stinson":
-            ucd_rail_voltage_stinson()
+        if platform in UCD_RAILS:
+            ucd_rail_voltage(platform)
         else :
             error_ucd_usage()
             return
@@ -3510,10 +3318,24 @@ def convert_tmp(manu_id,tmp_o):
 
     return tmp
 
+#
+# Records a failed command of a TMP reading, see tmp_read_lower()
+#
+def tmp_error(result, e, msg):
+    result['errors'].append("%s\n%s" % (e, msg))
+    if result['status'] is None:
+        result['status'] = e.returncode
+
 #
 # Lower board temperature sensors. Board exists on Montara, Mavericks and Newport
 #
-def tmp_lower(board):
+# Returns {'sensors': [TMP SENSOR 01 .. 05], 'local': LOCAL, 'tofino': the
+# Tofino die (DIE0 on Stinson and Davenport), 'errors': [...], 'status'} in
+# degrees C, Stinson adds 'tofino_die1'. Mavericks only has the sensors
+# here. A reading that failed is None and its error is listed in 'errors',
+# 'status' is the exit status of the first failed command.
+#
+def tmp_read_lower(board):
 
     i2c_dev = "/sys/class/i2c-adapter/i2c-3/3-00"
 
@@ -3523,6 +3345,9 @@ def tmp_lower(board):
                   4: "4b/temp1_input",
                   5: "4c/temp1_input"}
 
+    result = {'sensors': [], 'local': None, 'tofino': None, 'errors': [],
+              'status': None}
+
     if board == "Mavericks":
         x = 6
     else:
@@ -3534,12 +3359,11 @@ def tmp_lower(board):
         try:
             cmd = "cat"
             output = subprocess.check_output([cmd, path])
-            print " TMP SENSOR %.2d                  %.3f C" % (i,
-                                                          float(output) / 1000)
+            result['sensors'].append(float(output) / 1000)
 
         except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing TMP SENSOR %d" % i
+            result['sensors'].append(None)
+            tmp_error(result, e, "Error occured while processing TMP SENSOR %d" % i)
 
     if board == "Montara" or board == "Newport" or board == "Stinson" or board == "Davenport":
 
@@ -3554,6 +3378,10 @@ def tmp_lower(board):
             syslog.syslog(syslog.LOG_INFO, "btools.py TMP: Turn Off for PVT reading (%s)" % (sys_pn.rstrip()))
             np_tvp_workaround = 0
 
+        result['sensors'].append(None)
+        if board == "Stinson":
+            result['tofino_die1'] = None
+
         try:
             cmd = "i2cget"
             #TMP SENSORS 05:
@@ -3567,7 +3395,7 @@ def tmp_lower(board):
             t1 = ((swp_output >> (16-resolution)) * 1000) >> (resolution-8)
             if (output & 0xff) > 127:
                 t1 = t1-256000
-            print " TMP SENSOR %.2d                  %.3f C" % (5, float(t1)/1000)
+            result['sensors'][4] = float(t1)/1000
 
             # Destinguish the 0x4C, MAX6658/TMP431/TMP432
             manu_id = subprocess.check_output([cmd, "-f", "-y", "3",
@@ -3578,47 +3406,22 @@ def tmp_lower(board):
             output = subprocess.check_output([cmd, "-f", "-y", "3",
                                              "0x4c", "0x00"])
             output = int(output, 16)
-            output=convert_tmp(TMP_MAC_MANU_ID, output)
-            print " TMP SENSOR LOCAL               %.3f C" % output
+            result['local'] = convert_tmp(TMP_MAC_MANU_ID, output)
 
             if np_tvp_workaround == 0:
 
-              if board == "Stinson" :
-                #TMP SENSORS REMOTE1:
-                output = subprocess.check_output([cmd, "-f", "-y", "3",
+              #TMP SENSORS REMOTE1:
+              output = subprocess.check_output([cmd, "-f", "-y", "3",
                                              "0x4c", "0x01"])
-                output = int(output, 16)
-                output=convert_tmp(TMP_MAC_MANU_ID, output)
-                print " TMP SENSOR TOFINO DIE0         %.3f C" % (output)
+              output = int(output, 16)
+              result['tofino'] = convert_tmp(TMP_MAC_MANU_ID, output)
+
+              if board == "Stinson" :
                 #TMP SENSORS REMOTE2:
                 output = subprocess.check_output([cmd, "-f", "-y", "3",
                                                "0x4c", "0x23"])
                 output = int(output, 16)
-                output=convert_tmp(TMP_MAC_MANU_ID, output)
-                print " TMP SENSOR TOFINO DIE1         %.3f C" % (output)
-                return
-              if board == "Davenport" :
-                #TMP SENSORS REMOTE1:
-                output = subprocess.check_output([cmd, "-f", "-y", "3",
-                                             "0x4c", "0x01"])
-                output = int(output, 16)
-                output=convert_tmp(TMP_MAC_MANU_ID, output)
-                print " TMP SENSOR TOFINO DIE0         %.3f C" % (output)
-                return
-              if board == "Newport" :
-                #TMP SENSORS REMOTE1:
-                output = subprocess.check_output([cmd, "-f", "-y", "3",
-                                             "0x4c", "0x01"])
-                output = int(output, 16)
-                output=convert_tmp(TMP_MAC_MANU_ID, output)
-                print " TMP SENSOR TOFINO              %.3f C" % (output)
-                return
-              #TMP SENSORS REMOTE1:
-              output = subprocess.check_output([cmd, "-f", "-y", "3",
-                                             "0x4c", "0x01"])
-              output = int(output, 16)
-              output=convert_tmp(TMP_MAC_MANU_ID, output)
-              print " TMP SENSOR REMOTE TOFINO       %.3f C" % (output)
+                result['tofino_die1'] = convert_tmp(TMP_MAC_MANU_ID, output)
 
             else:  # read PVT register thru BMC i2c instead
               cmd = "/usr/local/bin/i2c_set_get"
@@ -3631,24 +3434,50 @@ def tmp_lower(board):
               upper = int(oplist[1], 0) & 0x3
               valid = int(oplist[1], 0) & 0x10
               if valid == 0: # reading is not valid
-                print " TMP SENSOR TOFINO 0.0 C"
-                return
+                result['tofino'] = 0.0
+                return result
               upper = (upper << 8) | lower
               x = float(upper)
               x2 = x * x
-              temperature = (x2 * (-0.000011677)) + (x * 0.28031) - 66.599
-              print " TMP SENSOR TOFINO              %.3f C" % (temperature)
+              result['tofino'] = (x2 * (-0.000011677)) + (x * 0.28031) - 66.599
 
         except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for TMP SENSOR 05/LOCAL/REMOTE"
+            tmp_error(result, e, "Error occured while processing i2cget for TMP SENSOR 05/LOCAL/REMOTE")
+
+    return result
+
+def tmp_lower(board):
+
+    r = tmp_read_lower(board)
+
+    for i in range(len(r['sensors'])):
+        if r['sensors'][i] is not None:
+            print " TMP SENSOR %.2d                  %.3f C" % (i + 1,
+                                                          r['sensors'][i])
+    if r['local'] is not None:
+        print " TMP SENSOR LOCAL               %.3f C" % r['local']
+    if r['tofino'] is not None:
+        if board == "Stinson" or board == "Davenport":
+            print " TMP SENSOR TOFINO DIE0         %.3f C" % (r['tofino'])
+        elif board == "Newport":
+            print " TMP SENSOR TOFINO              %.3f C" % (r['tofino'])
+        else:
+            print " TMP SENSOR REMOTE TOFINO       %.3f C" % (r['tofino'])
+    if r.get('tofino_die1') is not None:
+        print " TMP SENSOR TOFINO DIE1         %.3f C" % (r['tofino_die1'])
+    for e in r['errors']:
+        print e
 
     return
 
 #
 # Upper board temperature sensors. It only exists in Mavericks
 #
-def tmp_upper(p0c):
+# Returns {'sensors': [TMP SENSOR UPPER 01 .. 04], 'local': UPPER LOCAL,
+# 'tofino': UPPER REMOTE Tofino, 'errors': [...], 'status'} like
+# tmp_read_lower().
+#
+def tmp_read_upper(p0c):
 
     if (p0c == 1):
       TMP75_I2C_ADDR = {1: "0x48", 2: "0x49", 3: "0x4a", 4: "0x4b"}
@@ -3656,13 +3485,16 @@ def tmp_upper(p0c):
     else:
       TMP75_I2C_ADDR = {1: "0x48", 2: "0x49", 3: "0x4a", 4: "0x4b"}
 
+    result = {'sensors': [], 'local': None, 'tofino': None, 'errors': [],
+              'status': None}
+
     for i in range(1, 5):
 
         try:
             cmd = "i2cget"
             a = tmp_open_i2c_switch()
             while (a < 0):
-               time.sleep(0.010) # 10ms
+               sleep(0.010) # 10ms
                a = tmp_open_i2c_switch()
             output = subprocess.check_output([cmd, "-f", "-y", "9",
                                              TMP75_I2C_ADDR.get(i),
@@ -3681,18 +3513,18 @@ def tmp_upper(p0c):
             if d == 0x8000:
                 t1 = float(t) + .500
 
-            print " TMP SENSOR UPPER %.2d            %.3f C" % (i, t1)
+            result['sensors'].append(t1)
 
         except subprocess.CalledProcessError as e:
-            print e
-            print "Error occured while processing i2cget for Tmp75 %.2d " % (i)
+            result['sensors'].append(None)
+            tmp_error(result, e, "Error occured while processing i2cget for Tmp75 %.2d " % i)
             tmp_restore_i2c_switch(a)
 
     try:
         cmd = "i2cget"
         a = tmp_open_i2c_switch()
         while (a < 0):
-          time.sleep(0.010) # 10ms
+          sleep(0.010) # 10ms
           a = tmp_open_i2c_switch()
 
         # Destinguish the 0x4C, MAX6658/TMP431/TMP432
@@ -3704,24 +3536,63 @@ def tmp_upper(p0c):
         output = subprocess.check_output([cmd, "-f", "-y", "9",
                                           "0x4c", "0x00"])
         output = int(output, 16)
-        output=convert_tmp(TMP_MAC_MANU_ID, output)
-        print " TMP SENSOR UPPER LOCAL     %.2d.000 C" % (output)
+        result['local'] = convert_tmp(TMP_MAC_MANU_ID, output)
 
         # TMP UPPER SENSORS REMOTE:
         output = subprocess.check_output([cmd, "-f", "-y", "9",
                                           "0x4c", "0x01"])
         tmp_restore_i2c_switch(a)
         output = int(output, 16)
-        output=convert_tmp(TMP_MAC_MANU_ID, output)
-        print " TMP SENSOR UPPER REMOTE Tofino    %.2d.000 C" % (output)
+        result['tofino'] = convert_tmp(TMP_MAC_MANU_ID, output)
 
     except subprocess.CalledProcessError as e:
-        print e
-        print "Error occured while processing i2cget for TMP SENSOR UPPER LOCAL/REMOTE"
+        tmp_error(result, e, "Error occured while processing i2cget for TMP SENSOR UPPER LOCAL/REMOTE")
         tmp_restore_i2c_switch(a)
 
+    return result
+
+def tmp_upper(p0c):
+
+    r = tmp_read_upper(p0c)
+
+    for i in range(len(r['sensors'])):
+        if r['sensors'][i] is not None:
+            print " TMP SENSOR UPPER %.2d            %.3f C" % (i + 1, r['sensors'][i])
+    if r['local'] is not None:
+        print " TMP SENSOR UPPER LOCAL     %.2d.000 C" % (r['local'])
+    if r['tofino'] is not None:
+        print " TMP SENSOR UPPER REMOTE Tofino    %.2d.000 C" % (r['tofino'])
+    for e in r['errors']:
+        print e
+
     return
 
+TMP_BOARDS = {"montara": "Montara", "newport": "Newport",
+              "stinson": "Stinson", "davenport": "Davenport",
+              "mavericks": "Mavericks", "mavericks-p0c": "Mavericks"}
+
+#
+# Reads every temperature sensor of platform (detected if not given) and
+# returns {'lower': tmp_read_lower(), 'upper': tmp_read_upper()}, 'upper'
+# only on Mavericks.
+#
+def read_tmp(platform=None):
+
+    if platform is None:
+        platform = get_project()
+    if platform not in TMP_BOARDS:
+        raise ValueError("No temperature sensors known for %s" % platform)
+
+    result = {}
+    with BusLock(TMP_BUSES):
+        result['lower'] = tmp_read_lower(TMP_BOARDS[platform])
+        if platform == "mavericks":
+            result['upper'] = tmp_read_upper(0)
+        elif platform == "mavericks-p0c":
+            result['upper'] = tmp_read_upper(1)
+
+    return result
+
 #
 # Mavericks need i2c switch to be opened for reading temp sensors
 #
@@ -3844,7 +3715,6 @@ def error_usage():
 
 # Main function parses command line argument and call appropiate tool
 def main(argv):
-    os.system("touch /tmp/btools_lock")
     try:
         opts, args = getopt.getopt(argv[1:], "hP:U:I:T:", ["help", "PSU=", "UCD=", "IR=", "TMP="])
 
@@ -3858,27 +3728,24 @@ def main(argv):
         error_usage()
         return
 
-    lock_file = "/tmp/btools_lock"
-    fd = open(lock_file,'r')
-    fcntl.flock(fd, fcntl.LOCK_EX)
-
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             usage()
         elif opt in ("-P", "--PSU"):
-            psu(argv)
+            with BusLock(PSU_BUSES):
+                psu(argv)
         elif opt in ("-U", "--UCD"):
-            ucd(argv)
+            with BusLock(UCD_BUSES):
+                ucd(argv)
         elif opt in ("-I", "--IR"):
-            ir(argv)
+            with BusLock(IR_BUSES):
+                ir(argv)
         elif opt in ("-T", "--TMP"):
-            tmp(argv)
+            with BusLock(TMP_BUSES):
+                tmp(argv)
         else:
             error_usage()
 
-    fcntl.flock(fd, fcntl.LOCK_UN)
-    fd.close()
-
     return
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-present Facebook. All Rights Reserved.
+#
+# This program file is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program in a file named COPYING; if not, write to the
+# Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+#
+
+# Locks on the I2C buses shared by btools.py, the REST server and anything
+# else that talks to the devices behind them.
+
+import fcntl
+import os
+import threading
+
+LOCK_DIR = '/tmp/i2c_locks'
+
+_held = threading.local()
+
+def bus(number):
+    return 'i2c-%d' % number
+
+class BusLock(object):
+    '''
+    Exclusive lock on a set of I2C resources, e.g.
+    BusLock([bus(7), bus(12)]). Every resource is an flock()ed file in
+    LOCK_DIR, so the lock holds between threads as well as processes, and
+    resources are always taken in sorted order so that two operations
+    can't deadlock. A thread may take a resource it already holds again.
+
+    A mux switches the whole bus it sits on, so operations behind any of
+    its channels lock the parent bus, the same as the mux itself.
+    '''
+    def __init__(self, resources):
+        self.resources = sorted(set(resources))
+        self.taken = []
+
+    def __enter__(self):
+        if not hasattr(_held, 'files'):
+            _held.files = {}
+        try:
+            for resource in self.resources:
+                if resource in _held.files:
+                    _held.files[resource][1] += 1
+                else:
+                    if not os.path.isdir(LOCK_DIR):
+                        try:
+                            os.makedirs(LOCK_DIR)
+                        except OSError:
+                            # Made by someone else in the meantime
+                            pass
+                    f = open(os.path.join(LOCK_DIR, resource), 'a')
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    _held.files[resource] = [f, 1]
+                self.taken.append(resource)
+        except:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        for resource in reversed(self.taken):
+            entry = _held.files[resource]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _held.files[resource]
+                fcntl.flock(entry[0], fcntl.LOCK_UN)
+                entry[0].close()
+        self.taken = []
@@ -19,6 +19,7 @@
 # Created by Jeremy Chen, 19/01/28
 #
 import binascii
+import os
 import time
 import sys
 import subprocess
@@ -49,6 +50,8 @@ i2c_read_cmd = ""
 program_enable = 0
 brief_enable = 0
 
+FRUID_CACHE = "/usr/local/bin/fruid_cache.py"
+
 x_bmc_fru_eeprom_cmd_prompt = 0
 x_bmc_fru_eeprom_size = 1
 x_bmc_fru_eeprom_is_hex = 2
@@ -399,12 +402,19 @@ def get_user_input_fru_data():
         return -1
     return need_to_update
 
+# The REST API caches what weutil reads from the EEPROM; writes through
+# i2cset don't show in the sysfs file, so tell it to read again
+def invalidate_fruid_cache():
+    if os.access(FRUID_CACHE, os.X_OK):
+        subprocess.call([FRUID_CACHE, "--invalidate"])
+
 def bmc_write_fru_eeprom():
     if bmc_read_fru_eeprom() == 0:
         need_to_update = get_user_input_fru_data()
         if need_to_update:
             print ("PROGRAM EEPROM...")
-            bmc_update_fru_eeprom()
+            if bmc_update_fru_eeprom() == 0:
+                invalidate_fruid_cache()
     return 0
 
 def main(argv):
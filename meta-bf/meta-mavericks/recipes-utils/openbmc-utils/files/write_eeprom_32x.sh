@@ -14,6 +14,8 @@ if [ -e $eeprom ]; then
     cat $eeprom | hexdump -C > /tmp/old
 	dd if=/home/root/$1 of=$eeprom 
 	cat $eeprom | hexdump -C > /tmp/new
+	# let the REST API's FRUID cache read the EEPROM again
+	[ -x /usr/local/bin/fruid_cache.py ] && /usr/local/bin/fruid_cache.py --invalidate
 	
 	echo "write eeprom success"
 
@@ -4,6 +4,8 @@ from node import node
 from pal import *
 
 class fansNode(node):
+    cache_ttl = 5
+
     def __init__(self, name = None, info = None, actions = None):
         self.name = name
 